@@ -1,11 +1,20 @@
+import atexit
 import pygame
 import sys
-import random
+
+from snake_app import first_frame, init_display, shutdown
+from snake_autopilot import Autopilot
+from snake_core import SnakeSim, NORMAL, ATE, WON
+from snake_loop import FixedStep, InputQueue, RENDER_FPS
+from snake_profile import FrameProfiler
+from snake_render import SpriteAtlas, TextCache, fonts_ready, interpolate
+from snake_replay import Replay, ReplayWriter
 
 # Constants
 WIDTH, HEIGHT = 640, 480
 SNAKE_SIZE = 10
 SNAKE_SPEED = 15
+PROFILE_PHASES = ('events', 'update', 'background', 'snake', 'food', 'text', 'present', 'wait')
 
 # Updated colors for a modern look
 MODERN_BACKGROUND = (30, 30, 30)  # Dark gray
@@ -16,113 +25,136 @@ MODERN_TEXT_COLOR = (255, 255, 255)  # White
 
 class SnakeGame:
     def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption('Snake Game')
+        self.screen = init_display((WIDTH, HEIGHT), 'Snake Game')
         self.clock = pygame.time.Clock()
-        self.snake_pos = [[100, 50], [90, 50], [80, 50]]
-        self.snake_direction = 'RIGHT'
-        self.food_pos = self.spawn_food()
-        self.food_spawn = True
-        self.score = 0
-
-    def spawn_food(self):
-        return [random.randrange(1, (WIDTH // SNAKE_SIZE)) * SNAKE_SIZE,
-                random.randrange(1, (HEIGHT // SNAKE_SIZE)) * SNAKE_SIZE]
+        self.text = TextCache()
+        self.inputs = InputQueue()
+        size = (SNAKE_SIZE, SNAKE_SIZE)
+        self.atlas = SpriteAtlas({
+            'body': (size, (0, 0), lambda surface: pygame.draw.circle(
+                surface, MODERN_SNAKE_COLOR, (SNAKE_SIZE // 2, SNAKE_SIZE // 2), SNAKE_SIZE // 2)),
+            'food': (size, (0, 0), lambda surface: pygame.draw.circle(
+                surface, MODERN_FOOD_COLOR, (SNAKE_SIZE // 2, SNAKE_SIZE // 2), SNAKE_SIZE // 2)),
+        })
+        # Game rules live in the headless simulation, this class only renders
+        self.sim = SnakeSim(WIDTH // SNAKE_SIZE, HEIGHT // SNAKE_SIZE,
+                            start=((10, 5), (9, 5), (8, 5)))
+        self.replay = Replay(self.sim, SNAKE_SPEED)
+        self.replays = ReplayWriter()
+        self.autopilot = Autopilot() if '--autopilot' in sys.argv[1:] else None  # Toggled with A
+        self.autopiloted = False  # Autopilot games are not saved as replays
+        self.profiler = FrameProfiler(PROFILE_PHASES)  # Off until F3 or --trace
+        if '--trace' in sys.argv[1:]:
+            # Record from the start and write a Chrome trace on the way out
+            self.profiler.enable()
+            atexit.register(self.profiler.dump)
 
     # Updated draw_snake to use circles
-    def draw_snake(self):
-        for pos in self.snake_pos:
-            pygame.draw.circle(self.screen, MODERN_SNAKE_COLOR, (
-                pos[0] + SNAKE_SIZE // 2, pos[1] + SNAKE_SIZE // 2), SNAKE_SIZE // 2)
+    def draw_snake(self, alpha=1.0):
+        # Head and tail slide between cells while the next tick is due
+        moving = interpolate(self.sim, alpha)
+        skip = {cell for _, cell, _, _ in moving}
+        cols = self.sim.cols
+        cells = [(cell % cols, cell // cols) for cell in self.sim.body if cell not in skip]
+        segments = self.atlas.places('body', cells, SNAKE_SIZE)
+        segments += [self.atlas.place('body', x, y, SNAKE_SIZE) for _, _, x, y in moving]
+        self.screen.blits(segments, doreturn=False)
 
     # Updated draw_food to use a circle
     def draw_food(self):
-        pygame.draw.circle(self.screen, MODERN_FOOD_COLOR, (
-            self.food_pos[0] + SNAKE_SIZE // 2, self.food_pos[1] + SNAKE_SIZE // 2), SNAKE_SIZE // 2)
+        if self.sim.food is None:
+            return
+        self.screen.blit(*self.atlas.place('food', *self.sim.food, SNAKE_SIZE))
 
     def update_snake(self):
-        if self.snake_direction == 'RIGHT':
-            head_pos = [self.snake_pos[0][0] +
-                        SNAKE_SIZE, self.snake_pos[0][1]]
-        elif self.snake_direction == 'LEFT':
-            head_pos = [self.snake_pos[0][0] -
-                        SNAKE_SIZE, self.snake_pos[0][1]]
-        elif self.snake_direction == 'UP':
-            head_pos = [self.snake_pos[0][0],
-                        self.snake_pos[0][1] - SNAKE_SIZE]
-        elif self.snake_direction == 'DOWN':
-            head_pos = [self.snake_pos[0][0],
-                        self.snake_pos[0][1] + SNAKE_SIZE]
-        self.snake_pos.insert(0, head_pos)
-
-    def check_collisions(self):
-        # Wall collision
-        if (self.snake_pos[0][0] >= WIDTH or self.snake_pos[0][0] < 0 or
-                self.snake_pos[0][1] >= HEIGHT or self.snake_pos[0][1] < 0):
-            self.game_over()
-
-        # Self collision
-        if self.snake_pos[0] in self.snake_pos[1:]:
-            self.game_over()
-
-    def check_food_collision(self):
-        if self.snake_pos[0] == self.food_pos:
-            self.food_spawn = False
-            self.score += 1
+        if self.autopilot is not None:
+            self.inputs.clear()
+            self.sim.turn(self.autopilot.choose(self.sim))
+            self.autopiloted = True
         else:
-            self.snake_pos.pop()
-
-        if not self.food_spawn:
-            self.food_pos = self.spawn_food()
-            self.food_spawn = True
+            direction = self.inputs.pop()
+            if direction:
+                self.sim.turn(direction)
+        if self.sim.step() not in (NORMAL, ATE):
+            self.game_over()
 
     # Updated display_score to use modern text color
     def display_score(self):
-        font = pygame.font.SysFont('arial', 25)
-        score_surface = font.render(
-            f'Score: {self.score}', True, MODERN_TEXT_COLOR)
+        if not fonts_ready():
+            return  # The window shows before the system font scan is done
+        score_surface = self.text.render(
+            f'Score: {self.sim.score}', 25, MODERN_TEXT_COLOR)
         self.screen.blit(score_surface, (10, 10))
 
     # Updated game_over to use modern text color and background
     def game_over(self):
-        font = pygame.font.SysFont('arial', 50)
-        game_over_surface = font.render('Game Over', True, MODERN_TEXT_COLOR)
+        if not self.autopiloted:
+            self.replays.save(self.replay, self.sim)
+        message = 'You Win' if self.sim.outcome == WON else 'Game Over'
+        game_over_surface = self.text.render(message, 50, MODERN_TEXT_COLOR)
         self.screen.fill(MODERN_BACKGROUND)
         self.screen.blit(game_over_surface, (WIDTH // 4, HEIGHT // 3))
         pygame.display.flip()
         pygame.time.wait(2000)
-        pygame.quit()
+        print(self.inputs.summary())
+        shutdown()
         sys.exit()
 
+    def draw(self, alpha):
+        # Updated the main loop to use the modern background color
+        self.screen.fill(MODERN_BACKGROUND)
+        self.profiler.lap('background')
+        self.draw_snake(alpha)
+        self.profiler.lap('snake')
+        self.draw_food()
+        self.profiler.lap('food')
+        self.display_score()
+        if self.profiler.enabled and fonts_ready():
+            stats = self.profiler.render(self.text.font(14, 'monospace'), MODERN_TEXT_COLOR,
+                                         RENDER_FPS, SNAKE_SPEED)
+            self.screen.blit(stats, stats.get_rect(bottomleft=(10, HEIGHT - 10)))
+        self.profiler.lap('text')
+
+        pygame.display.update()
+        self.profiler.lap('present')
+        self.inputs.presented()
+
     def run(self):
+        self.draw(0.0)
+        first_frame()
+        # The snake moves SNAKE_SPEED times a second, frames are drawn at RENDER_FPS
+        stepper = FixedStep(SNAKE_SPEED)
         while True:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
+                    print(self.inputs.summary())
+                    shutdown()
                     sys.exit()
                 elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RIGHT and self.snake_direction != 'LEFT':
-                        self.snake_direction = 'RIGHT'
-                    elif event.key == pygame.K_LEFT and self.snake_direction != 'RIGHT':
-                        self.snake_direction = 'LEFT'
-                    elif event.key == pygame.K_UP and self.snake_direction != 'DOWN':
-                        self.snake_direction = 'UP'
-                    elif event.key == pygame.K_DOWN and self.snake_direction != 'UP':
-                        self.snake_direction = 'DOWN'
-
-            self.update_snake()
-            self.check_collisions()
-            self.check_food_collision()
-
-            # Updated the main loop to use the modern background color
-            self.screen.fill(MODERN_BACKGROUND)
-            self.draw_snake()
-            self.draw_food()
-            self.display_score()
-
-            pygame.display.update()
-            self.clock.tick(SNAKE_SPEED)
+                    if event.key == pygame.K_F3:
+                        self.profiler.toggle()
+                    elif event.key == pygame.K_RIGHT:
+                        self.inputs.push('RIGHT', self.sim.direction)
+                    elif event.key == pygame.K_LEFT:
+                        self.inputs.push('LEFT', self.sim.direction)
+                    elif event.key == pygame.K_UP:
+                        self.inputs.push('UP', self.sim.direction)
+                    elif event.key == pygame.K_DOWN:
+                        self.inputs.push('DOWN', self.sim.direction)
+                    elif event.key == pygame.K_a:
+                        self.autopilot = None if self.autopilot else Autopilot()
+
+            self.profiler.lap('events')
+
+            ticks = stepper.advance()
+            for _ in range(ticks):
+                self.update_snake()
+            self.profiler.lap('update')
+
+            self.draw(stepper.alpha)
+            self.clock.tick(RENDER_FPS)
+            self.profiler.lap('wait')
+            self.profiler.end_frame(ticks)
 
 
 if __name__ == '__main__':
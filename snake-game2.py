@@ -1,25 +1,22 @@
+import atexit
 import os
 os.environ['SDL_AUDIODRIVER'] = 'dummy'  # Suppress ALSA warnings
 
 import pygame
 import sys
-import random
 
-# Initialize Pygame and set up display
-pygame.init()
+from snake_app import Sounds, first_frame, init_display, shutdown
+from snake_autopilot import Autopilot
+from snake_core import SnakeSim, ATE, DIED, WON, DIFFICULTY_SPEEDS
+from snake_loop import FixedStep, InputQueue, RENDER_FPS
+from snake_profile import FrameProfiler
+from snake_render import DirtyRenderer, SpriteAtlas, TextCache, fonts_ready, paint_glow
+from snake_replay import Replay, ReplayWriter
+from snake_scores import ScoreStore
+
+# The display is set up by bootstrap(), importing this module has no side effects
 width, height = 640, 480
-screen = pygame.display.set_mode((width, height))
-pygame.display.set_caption('Snake Game')
-
-# Initialize sound if available
-try:
-    pygame.mixer.init()
-    eat_sound = pygame.mixer.Sound('eat.wav')
-    game_over_sound = pygame.mixer.Sound('game_over.wav')
-except (pygame.error, FileNotFoundError):
-    pygame.mixer.quit()  # Clean up if initialization failed
-    eat_sound = None
-    game_over_sound = None
+screen = None
 
 # Colors
 BACKGROUND = (40, 44, 52)  # Dark modern background
@@ -37,148 +34,153 @@ MIN_SPEED = 5
 MAX_SPEED = 25
 SPEED_STEP = 1
 GRID_SIZE = 20
+DIRTY_RECTS = True  # Only redraw changed cells, False repaints the whole window every frame
+PROFILE_PHASES = ('events', 'update', 'text', 'board', 'present', 'wait')
 
 FOOD_TYPES = {
     'normal': {'color': FOOD_NORMAL, 'points': 1},
     'bonus': {'color': FOOD_BONUS, 'points': 3}
 }
 
+def bootstrap():
+    global screen
+    screen = init_display((width, height), 'Snake Game')
+
+
 class Game:
     def __init__(self):
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont('arial', 20)
-        self.large_font = pygame.font.SysFont('arial', 40)
+        # Sound is optional and loads in the background
+        self.sounds = Sounds({'eat': 'eat.wav', 'game_over': 'game_over.wav'})
+        self.text = TextCache()
+        self.inputs = InputQueue()
+        self.scores = ScoreStore()  # Loaded once, written in the background
+        self.replays = ReplayWriter()
         self.difficulty = 'normal'  # 'easy', 'normal', 'hard'
         self.paused = False
         self.selecting_speed = True
+        self.autopilot = None  # Plays by itself when set, toggled with A
+        self.renderer = DirtyRenderer(GRID_SIZE, BACKGROUND, GRID_COLOR)
+        self.renderer.resize((width, height))
+        self.atlas = self.bake_sprites()
+        self.profiler = FrameProfiler(PROFILE_PHASES)  # Off until F3 or --trace
         self.reset_game()
 
     def get_difficulty_speed(self):
-        speeds = {'easy': 8, 'normal': 12, 'hard': 16}
-        return speeds[self.difficulty]
+        return DIFFICULTY_SPEEDS[self.difficulty]
 
     def reset_game(self):
-        self.snake_pos = [[100, 50], [90, 50], [80, 50]]
-        self.snake_direction = 'RIGHT'
-        self.score = 0
-        self.high_score = self.load_high_score()
-        self.food = self.generate_food()
+        self.inputs.clear()
+        self.sim = SnakeSim(width // SNAKE_SIZE, height // SNAKE_SIZE,
+                            food_points={k: v['points'] for k, v in FOOD_TYPES.items()},
+                            bonus_chance=0.2)  # 20% chance for bonus food
+        self.replay = Replay(self.sim)
+        self.high_score = self.scores.best
         self.game_over = False
+        self.autopiloted = False  # Autopilot games stay off the leaderboard and out of replays/
+        self.renderer.invalidate()
         self.bonus_food_timer = 0
         self.speed = 12  # Initial speed
         
-    def load_high_score(self):
-        try:
-            with open('highscore.txt', 'r') as f:
-                return int(f.read())
-        except:
-            return 0
-
     def save_high_score(self):
-        with open('highscore.txt', 'w') as f:
-            f.write(str(max(self.score, self.high_score)))
-
-    def generate_food(self):
-        food_type = 'bonus' if random.random() < 0.2 else 'normal'  # 20% chance for bonus food
-        pos = [random.randrange(1, (width//10)) * 10, 
-               random.randrange(1, (height//10)) * 10]
-        while pos in self.snake_pos:
-            pos = [random.randrange(1, (width//10)) * 10, 
-                   random.randrange(1, (height//10)) * 10]
-        return {'pos': pos, 'type': food_type}
+        self.scores.submit(self.score, self.difficulty, self.speed)
+
+    @property
+    def score(self):
+        return self.sim.score
 
     def update(self):
+        if self.game_over and self.autopilot is not None:
+            self.reset_game()  # Attract mode keeps playing
         if not self.game_over:
-            # Update snake position
-            new_head = self.get_new_head()
-            self.snake_pos.insert(0, new_head)
-
-            # Check collisions
-            if self.check_collision():
-                self.game_over = True
-                self.save_high_score()
-                if game_over_sound:
-                    game_over_sound.play()
-                return
-
-            # Check food collision
-            if self.snake_pos[0] == self.food['pos']:
-                points = FOOD_TYPES[self.food['type']]['points']
-                if self.difficulty == 'hard':
-                    points *= 2  # Double points on hard mode
-                self.score += points
-                self.food = self.generate_food()
-                if eat_sound:
-                    eat_sound.play()
+            self.sim.multiplier = 2 if self.difficulty == 'hard' else 1  # Double points on hard mode
+            if self.autopilot is not None:
+                self.inputs.clear()
+                self.sim.turn(self.autopilot.choose(self.sim))
+                self.autopiloted = True
             else:
-                self.snake_pos.pop()
-
-    def get_new_head(self):
-        head = self.snake_pos[0].copy()
-        if self.snake_direction == 'RIGHT':
-            head[0] += SNAKE_SIZE
-        elif self.snake_direction == 'LEFT':
-            head[0] -= SNAKE_SIZE
-        elif self.snake_direction == 'UP':
-            head[1] -= SNAKE_SIZE
-        elif self.snake_direction == 'DOWN':
-            head[1] += SNAKE_SIZE
-        return head
-
-    def check_collision(self):
-        head = self.snake_pos[0]
-        return (head[0] >= width or head[0] < 0 or 
-                head[1] >= height or head[1] < 0 or 
-                head in self.snake_pos[1:])
-
-    def draw(self):
-        screen.fill(BACKGROUND)
-        
+                direction = self.inputs.pop()
+                if direction:
+                    self.sim.turn(direction)
+            outcome = self.sim.step()
+            if outcome in (DIED, WON):
+                self.game_over = True
+                self.renderer.invalidate()
+                if not self.autopiloted:
+                    self.save_high_score()
+                    self.replay.speed = self.speed
+                    self.replays.save(self.replay, self.sim)
+                self.sounds.play('game_over')
+            elif outcome == ATE:
+                self.sounds.play('eat')
+
+    def bake_sprites(self):
+        # Snake with rounded corners
+        def segment(color):
+            return lambda surface: pygame.draw.rect(surface, color,
+                                                    pygame.Rect(0, 0, SNAKE_SIZE-2, SNAKE_SIZE-2),
+                                                    border_radius=8)
+
+        # Food with glow effect
+        def food(color):
+            def paint(surface):
+                paint_glow(surface, color, SNAKE_SIZE//2, 4, 50)
+                pygame.draw.circle(surface, color, (SNAKE_SIZE//2+4, SNAKE_SIZE//2+4), SNAKE_SIZE//2-1)
+            return paint
+
+        sprites = {
+            'head': ((SNAKE_SIZE-2, SNAKE_SIZE-2), (0, 0), segment(SNAKE_HEAD)),
+            'body': ((SNAKE_SIZE-2, SNAKE_SIZE-2), (0, 0), segment(SNAKE_BODY)),
+        }
+        for name, food_type in FOOD_TYPES.items():
+            sprites[name] = ((SNAKE_SIZE+8, SNAKE_SIZE+8), (-4, -4), food(food_type['color']))
+        return SpriteAtlas(sprites)
+
+    def draw(self, alpha=None):
         if self.selecting_speed:
-            title_text = self.large_font.render("Select Speed", True, TEXT_COLOR)
-            speed_text = self.large_font.render(str(self.speed), True, TEXT_COLOR)
-            instruction_text = self.font.render("Use +/- to adjust speed, ENTER to start", True, TEXT_COLOR)
-            
-            screen.blit(title_text, [width/2 - 100, height/2 - 100])
-            screen.blit(speed_text, [width/2 - 20, height/2 - 20])
-            screen.blit(instruction_text, [width/2 - 150, height/2 + 50])
+            screen.fill(BACKGROUND)
+            # The window shows before the system font scan is done, text follows
+            if fonts_ready():
+                title_text = self.text.render("Select Speed", 40, TEXT_COLOR)
+                speed_text = self.text.render(str(self.speed), 40, TEXT_COLOR)
+                instruction_text = self.text.render("Use +/- to adjust speed, ENTER to start", 20, TEXT_COLOR)
+
+                screen.blit(title_text, [width/2 - 100, height/2 - 100])
+                screen.blit(speed_text, [width/2 - 20, height/2 - 20])
+                screen.blit(instruction_text, [width/2 - 150, height/2 + 50])
             pygame.display.update()
+            self.profiler.lap('present')
+            self.renderer.invalidate()
             return
-        
-        # Draw grid
-        for x in range(0, width, GRID_SIZE):
-            pygame.draw.line(screen, GRID_COLOR, (x, 0), (x, height))
-        for y in range(0, height, GRID_SIZE):
-            pygame.draw.line(screen, GRID_COLOR, (0, y), (width, y))
-        
-        # Draw snake with rounded corners
-        for i, pos in enumerate(self.snake_pos):
-            color = SNAKE_HEAD if i == 0 else SNAKE_BODY
-            pygame.draw.rect(screen, color,
-                           pygame.Rect(pos[0], pos[1], SNAKE_SIZE-2, SNAKE_SIZE-2),
-                           border_radius=8)
-
-        # Draw food with glow effect
-        food_color = FOOD_TYPES[self.food['type']]['color']
-        food_pos = self.food['pos']
-        # Glow effect
-        for size in range(4, 0, -1):
-            alpha_surface = pygame.Surface((SNAKE_SIZE+8, SNAKE_SIZE+8), pygame.SRCALPHA)
-            pygame.draw.circle(alpha_surface, (*food_color, 50),
-                             (SNAKE_SIZE//2+4, SNAKE_SIZE//2+4), SNAKE_SIZE//2 + size)
-            screen.blit(alpha_surface, (food_pos[0]-4, food_pos[1]-4))
-        # Main food
-        pygame.draw.circle(screen, food_color,
-                         (food_pos[0]+SNAKE_SIZE//2, food_pos[1]+SNAKE_SIZE//2),
-                         SNAKE_SIZE//2-1)
+
+        if self.game_over and not self.renderer.full:
+            return  # The game over screen does not change until restart
+        if not DIRTY_RECTS:
+            self.renderer.invalidate()
+
+        overlays = []
+        if self.sim.food is not None:
+            food_rect = pygame.Rect(self.sim.food[0] * SNAKE_SIZE - 4, self.sim.food[1] * SNAKE_SIZE - 4,
+                                    SNAKE_SIZE + 8, SNAKE_SIZE + 8)
+            food_sprite = self.atlas.place(self.sim.food_type, *self.sim.food, SNAKE_SIZE)
+            overlays.append(('food', food_rect, (self.sim.food, self.sim.food_type),
+                             lambda: screen.blit(*food_sprite)))
 
         # Draw scores with modern style
-        score_text = self.font.render(f"Score: {self.score}", True, TEXT_COLOR)
-        high_score_text = self.font.render(f"High Score: {self.high_score}", True, TEXT_COLOR)
-        speed_text = self.font.render(f"Speed: {self.speed}", True, TEXT_COLOR)
-        screen.blit(score_text, [20, 20])
-        screen.blit(high_score_text, [width - 170, 20])
-        screen.blit(speed_text, [width//2 - 50, 20])
+        for name, text, pos in (('score', f"Score: {self.score}", [20, 20]),
+                                ('high_score', f"High Score: {self.high_score}", [width - 170, 20]),
+                                ('speed', f"Speed: {self.speed}", [width//2 - 50, 20])):
+            surface = self.text.render(text, 20, TEXT_COLOR)
+            overlays.append((name, surface.get_rect(topleft=pos), text,
+                             lambda surface=surface, pos=pos: screen.blit(surface, pos)))
+
+        if self.profiler.enabled and fonts_ready():
+            stats = self.profiler.render(self.text.font(14, 'monospace'), TEXT_COLOR, RENDER_FPS, self.speed)
+            stats_rect = stats.get_rect(bottomleft=(10, height - 10))
+            overlays.append(('profile', stats_rect, stats, lambda: screen.blit(stats, stats_rect)))
+        self.profiler.lap('text')
+
+        rects = self.renderer.draw(screen, self.sim, self.atlas, overlays, alpha)
 
         if self.game_over:
             # Semi-transparent overlay
@@ -187,44 +189,69 @@ class Game:
             overlay.set_alpha(180)
             screen.blit(overlay, (0,0))
             
-            game_over_text = self.large_font.render("Game Over!", True, GAME_OVER_COLOR)
-            restart_text = self.font.render("Press R to Restart or Q to Quit", True, TEXT_COLOR)
+            message = "You Win!" if self.sim.outcome == WON else "Game Over!"
+            game_over_text = self.text.render(message, 40, GAME_OVER_COLOR)
+            restart_text = self.text.render("Press R to Restart or Q to Quit", 20, TEXT_COLOR)
             screen.blit(game_over_text, [width/2 - 100, height/2 - 50])
             screen.blit(restart_text, [width/2 - 150, height/2 + 10])
+            top = self.scores.leaderboard(self.difficulty, self.speed)[:5]
+            top_text = self.text.render("Top " + self.difficulty + ": " + "  ".join(map(str, top)), 20, TEXT_COLOR)
+            screen.blit(top_text, [width/2 - 150, height/2 + 40])
+        self.profiler.lap('board')
 
-        pygame.display.update()
+        pygame.display.update(rects)
+        self.profiler.lap('present')
+        self.inputs.presented()
 
 def main():
+    bootstrap()
     game = Game()
+    if '--autopilot' in sys.argv[1:]:
+        game.autopilot = Autopilot()
+        game.selecting_speed = False
+    if '--trace' in sys.argv[1:]:
+        # Record from the start and write a Chrome trace on the way out
+        game.profiler.enable()
+        atexit.register(game.profiler.dump)
+    game.draw()
+    first_frame()
+    # The snake moves game.speed times a second, frames are drawn at RENDER_FPS
+    stepper = FixedStep(game.speed)
 
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
+                print(game.inputs.summary())
+                shutdown()
                 sys.exit()
             
             if event.type == pygame.KEYDOWN:
-                if game.game_over:
+                if event.key == pygame.K_F3:
+                    game.profiler.toggle()
+                elif game.game_over:
                     if event.key == pygame.K_q:
-                        pygame.quit()
+                        print(game.inputs.summary())
+                        shutdown()
                         sys.exit()
                     if event.key == pygame.K_r:
                         game.reset_game()
                 else:
-                    if event.key == pygame.K_RIGHT and game.snake_direction != 'LEFT':
-                        game.snake_direction = 'RIGHT'
-                    elif event.key == pygame.K_LEFT and game.snake_direction != 'RIGHT':
-                        game.snake_direction = 'LEFT'
-                    elif event.key == pygame.K_UP and game.snake_direction != 'DOWN':
-                        game.snake_direction = 'UP'
-                    elif event.key == pygame.K_DOWN and game.snake_direction != 'UP':
-                        game.snake_direction = 'DOWN'
+                    if event.key == pygame.K_RIGHT:
+                        game.inputs.push('RIGHT', game.sim.direction)
+                    elif event.key == pygame.K_LEFT:
+                        game.inputs.push('LEFT', game.sim.direction)
+                    elif event.key == pygame.K_UP:
+                        game.inputs.push('UP', game.sim.direction)
+                    elif event.key == pygame.K_DOWN:
+                        game.inputs.push('DOWN', game.sim.direction)
                     elif event.key == pygame.K_PLUS or event.key == pygame.K_KP_PLUS:
                         game.speed = min(MAX_SPEED, game.speed + SPEED_STEP)
                     elif event.key == pygame.K_MINUS or event.key == pygame.K_KP_MINUS:
                         game.speed = max(MIN_SPEED, game.speed - SPEED_STEP)
                     elif event.key == pygame.K_p:
                         game.paused = not game.paused
+                    elif event.key == pygame.K_a:
+                        game.autopilot = None if game.autopilot else Autopilot()
                     elif event.key == pygame.K_1:
                         game.difficulty = 'easy'
                         game.speed = game.get_difficulty_speed()
@@ -237,17 +264,24 @@ def main():
                     elif event.key == pygame.K_RETURN and game.selecting_speed:
                         game.selecting_speed = False
 
-        if game.selecting_speed:
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_PLUS] or keys[pygame.K_KP_PLUS]:
-                game.speed = min(MAX_SPEED, game.speed + SPEED_STEP)
-            elif keys[pygame.K_MINUS] or keys[pygame.K_KP_MINUS]:
-                game.speed = max(MIN_SPEED, game.speed - SPEED_STEP)
-            game.draw()
-        else:
-            game.update()
-            game.draw()
-        game.clock.tick(game.speed)
+        game.profiler.lap('events')
+
+        stepper.rate = game.speed
+        ticks = stepper.advance()
+        for _ in range(ticks):
+            if game.selecting_speed:
+                keys = pygame.key.get_pressed()
+                if keys[pygame.K_PLUS] or keys[pygame.K_KP_PLUS]:
+                    game.speed = min(MAX_SPEED, game.speed + SPEED_STEP)
+                elif keys[pygame.K_MINUS] or keys[pygame.K_KP_MINUS]:
+                    game.speed = max(MIN_SPEED, game.speed - SPEED_STEP)
+            else:
+                game.update()
+        game.profiler.lap('update')
+        game.draw(stepper.alpha)
+        game.clock.tick(RENDER_FPS)
+        game.profiler.lap('wait')
+        game.profiler.end_frame(ticks)
 
 if __name__ == "__main__":
     main()
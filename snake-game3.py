@@ -1,15 +1,22 @@
+import atexit
 import os
 os.environ['SDL_AUDIODRIVER'] = 'dummy'  # Suppress ALSA warnings
 
 import pygame
 import sys
-import random
 
-# Initialize Pygame and set up display
-pygame.init()
+from snake_app import first_frame, init_display, shutdown
+from snake_arena import ArenaSim, ArenaPilot
+from snake_autopilot import Autopilot
+from snake_core import SnakeSim, SparseSnakeSim, NORMAL, ATE, WON
+from snake_loop import FixedStep, InputQueue, RENDER_FPS
+from snake_profile import FrameProfiler
+from snake_render import ArenaRenderer, DirtyRenderer, SpriteAtlas, TextCache, ViewportRenderer, fonts_ready
+from snake_replay import Replay, ReplayWriter
+
+# The display is set up by bootstrap(), importing this module has no side effects
 width, height = 640, 480
-screen = pygame.display.set_mode((width, height))
-pygame.display.set_caption('Snake Game')
+screen = None
 
 # Colors
 BACKGROUND = (40, 44, 52)
@@ -19,144 +26,304 @@ SNAKE_BODY = (85, 181, 199)
 FOOD_NORMAL = (249, 38, 114)
 FOOD_BONUS = (253, 151, 31)
 TEXT_COLOR = (248, 248, 242)
+PLAYER_COLOR = (166, 226, 46)
 GAME_OVER_COLOR = (249, 38, 114)
 
 # Game settings
 SNAKE_SIZE = 20
 GRID_SIZE = 20
+SNAKE_SPEED = 10
+DIRTY_RECTS = True  # Only redraw changed cells, False repaints the whole window every frame
+PROFILE_PHASES = ('events', 'update', 'text', 'board', 'present', 'wait')
+HUGE_BOARD = (10000, 10000)  # Cells in --huge mode, where the window is a camera onto the board
+ARENA_SNAKES = 200  # Snakes in --arena mode unless a number follows it
+ARENA_CELL = 5  # Pixels per cell in --arena mode
+ARENA_FOOD = 0.5  # Food on the arena board per snake
+PLAYER = 0  # The player's snake id in the arena
+RESPAWN_TICKS = SNAKE_SPEED
 FOOD_TYPES = {
     'normal': {'color': FOOD_NORMAL, 'points': 1},
     'bonus': {'color': FOOD_BONUS, 'points': 3}
 }
 
+def bootstrap():
+    global screen
+    screen = init_display((width, height), 'Snake Game')
+
+
 class Game:
-    def __init__(self):
+    def __init__(self, huge=None):
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont('arial', 20)
-        self.large_font = pygame.font.SysFont('arial', 40)
+        self.text = TextCache()
+        self.inputs = InputQueue()
+        self.huge = huge  # (cols, rows) of a board bigger than the window, or None
+        self.renderer = self.make_renderer()
+        self.renderer.resize((width, height))
+        self.atlas = self.bake_sprites()
+        self.autopilot = None  # Plays by itself when set, toggled with A
+        self.replays = ReplayWriter()
+        self.profiler = FrameProfiler(PROFILE_PHASES)  # Off until F3 or --trace
         self.reset_game()
 
+    def make_renderer(self):
+        if self.huge:
+            return ViewportRenderer(GRID_SIZE, BACKGROUND, GRID_COLOR, SNAKE_BODY, FOOD_NORMAL)
+        return DirtyRenderer(GRID_SIZE, BACKGROUND, GRID_COLOR)
+
     def reset_game(self):
-        self.snake_pos = [[100, 50], [90, 50], [80, 50]]
-        self.snake_direction = 'RIGHT'
-        self.score = 0
-        self.food = self.generate_food()
+        self.inputs.clear()
+        food_points = {k: v['points'] for k, v in FOOD_TYPES.items()}
+        if self.huge:
+            cols, rows = self.huge
+            x, y = cols // 2, rows // 2
+            self.sim = SparseSnakeSim(cols, rows, start=((x, y), (x - 1, y), (x - 2, y)),
+                                      food_points=food_points)
+            self.replay = None  # Replays are verified on a dense SnakeSim
+        else:
+            self.sim = SnakeSim(width // GRID_SIZE, height // GRID_SIZE, food_points=food_points)
+            self.replay = Replay(self.sim, SNAKE_SPEED)
         self.game_over = False
+        self.autopiloted = False  # Autopilot games are not saved as replays
         self.paused = False
-
-    def generate_food(self):
-        pos = [random.randrange(1, (width//GRID_SIZE)) * GRID_SIZE, 
-               random.randrange(1, (height//GRID_SIZE)) * GRID_SIZE]
-        while pos in self.snake_pos:
-            pos = [random.randrange(1, (width//GRID_SIZE)) * GRID_SIZE, 
-                   random.randrange(1, (height//GRID_SIZE)) * GRID_SIZE]
-        return {'pos': pos, 'type': 'normal'}
+        self.renderer.invalidate()
 
     def update(self):
+        if self.game_over and self.autopilot is not None:
+            self.reset_game()  # Attract mode keeps playing
         if not self.game_over and not self.paused:
-            new_head = self.get_new_head()
-            self.snake_pos.insert(0, new_head)
-
-            if self.check_collision():
-                self.game_over = True
-                return
-
-            # Adjust collision detection for food
-            head_x, head_y = self.snake_pos[0]
-            food_x, food_y = self.food['pos']
-            if abs(head_x - food_x) < SNAKE_SIZE and abs(head_y - food_y) < SNAKE_SIZE:
-                self.score += FOOD_TYPES[self.food['type']]['points']
-                self.food = self.generate_food()
+            if self.autopilot is not None:
+                self.inputs.clear()
+                self.sim.turn(self.autopilot.choose(self.sim))
+                self.autopiloted = True
             else:
-                self.snake_pos.pop()
-
-    def get_new_head(self):
-        head = self.snake_pos[0].copy()
-        if self.snake_direction == 'RIGHT':
-            head[0] += SNAKE_SIZE
-        elif self.snake_direction == 'LEFT':
-            head[0] -= SNAKE_SIZE
-        elif self.snake_direction == 'UP':
-            head[1] -= SNAKE_SIZE
-        elif self.snake_direction == 'DOWN':
-            head[1] += SNAKE_SIZE
-        return head
-
-    def check_collision(self):
-        head = self.snake_pos[0]
-        return (head[0] >= width or head[0] < 0 or 
-                head[1] >= height or head[1] < 0 or 
-                head in self.snake_pos[1:])
+                direction = self.inputs.pop()
+                if direction:
+                    self.sim.turn(direction)
+            self.game_over = self.sim.step() not in (NORMAL, ATE)
+            if self.game_over:
+                self.renderer.invalidate()
+                if self.replay is not None and not self.autopiloted:
+                    self.replays.save(self.replay, self.sim)
+
+    def steer(self, direction):
+        self.inputs.push(direction, self.sim.direction)
 
     def handle_resize(self, event):
         global width, height, screen
         width, height = event.w, event.h
         screen = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+        if not self.huge:
+            self.sim.resize(width // GRID_SIZE, height // GRID_SIZE)
+        self.renderer.resize((width, height))
+        self.atlas = self.bake_sprites()
+        self.text.clear()
 
-    def draw(self):
-        screen.fill(BACKGROUND)
+    def bake_sprites(self):
+        size = (SNAKE_SIZE, SNAKE_SIZE)
+        sprites = {
+            'head': (size, (0, 0), lambda surface: surface.fill(SNAKE_BODY)),
+            'body': (size, (0, 0), lambda surface: surface.fill(SNAKE_BODY)),
+        }
+        for name, food_type in FOOD_TYPES.items():
+            sprites[name] = (size, (0, 0), lambda surface, color=food_type['color']: surface.fill(color))
+        return SpriteAtlas(sprites)
 
-        # Draw grid lines
-        for x in range(0, width, GRID_SIZE):
-            pygame.draw.line(screen, GRID_COLOR, (x, 0), (x, height))
-        for y in range(0, height, GRID_SIZE):
-            pygame.draw.line(screen, GRID_COLOR, (0, y), (width, y))
+    def draw(self, alpha=None):
+        if self.paused:
+            alpha = 1.0  # Hold the snake still instead of replaying the last move
+        if self.game_over and not self.renderer.full:
+            return  # The game over screen does not change until restart
+        if not DIRTY_RECTS:
+            self.renderer.invalidate()
 
-        for pos in self.snake_pos:
-            pygame.draw.rect(screen, SNAKE_BODY, pygame.Rect(pos[0], pos[1], SNAKE_SIZE, SNAKE_SIZE))
-
-        food_pos = self.food['pos']
-        pygame.draw.rect(screen, FOOD_TYPES[self.food['type']]['color'], pygame.Rect(food_pos[0], food_pos[1], SNAKE_SIZE, SNAKE_SIZE))
+        overlays = []
+        if self.sim.food is not None and not self.huge:
+            food_x, food_y = self.sim.food
+            food_rect = pygame.Rect(food_x * GRID_SIZE, food_y * GRID_SIZE, SNAKE_SIZE, SNAKE_SIZE)
+            food_sprite = self.atlas.place(self.sim.food_type, food_x, food_y, GRID_SIZE)
+            overlays.append(('food', food_rect, (self.sim.food, self.sim.food_type),
+                             lambda: screen.blit(*food_sprite)))
 
         # Dynamically adjust text size based on screen dimensions
         dynamic_font_size = max(20, min(width // 32, height // 24))
-        dynamic_font = pygame.font.SysFont('arial', dynamic_font_size)
 
-        score_text = dynamic_font.render(f"Score: {self.score}", True, TEXT_COLOR)
-        screen.blit(score_text, [10, 10])
+        # The window shows before the system font scan is done, the score follows
+        if fonts_ready() or self.game_over:
+            score_text = self.text.render(f"Score: {self.sim.score}", dynamic_font_size, TEXT_COLOR)
+            overlays.append(('score', score_text.get_rect(topleft=(10, 10)), self.sim.score,
+                             lambda: screen.blit(score_text, [10, 10])))
+
+        self.add_profile(overlays)
+        self.profiler.lap('text')
+
+        rects = self.renderer.draw(screen, self.sim, self.atlas, overlays, alpha)
 
         if self.game_over:
-            game_over_text = dynamic_font.render("Game Over!", True, GAME_OVER_COLOR)
-            restart_text = dynamic_font.render("Press R to Restart or Q to Quit", True, TEXT_COLOR)
+            message = "You Win!" if self.sim.outcome == WON else "Game Over!"
+            game_over_text = self.text.render(message, dynamic_font_size, GAME_OVER_COLOR)
+            restart_text = self.text.render("Press R to Restart or Q to Quit", dynamic_font_size, TEXT_COLOR)
             screen.blit(game_over_text, [width//2 - 100, height//2 - 50])
             screen.blit(restart_text, [width//2 - 150, height//2])
+        self.profiler.lap('board')
+
+        pygame.display.update(rects)
+        self.profiler.lap('present')
+        self.inputs.presented()
+
+    def add_profile(self, overlays):
+        if self.profiler.enabled and fonts_ready():
+            stats = self.profiler.render(self.text.font(14, 'monospace'), TEXT_COLOR, RENDER_FPS, SNAKE_SPEED)
+            stats_rect = stats.get_rect(bottomleft=(10, height - 10))
+            overlays.append(('profile', stats_rect, stats, lambda: screen.blit(stats, stats_rect)))
+
+
+class ArenaGame(Game):
+    # --arena: the player's snake among ArenaPilot snakes on one board, the
+    # same rules and food as the single game. Snakes that die come back a
+    # moment later, so the game never ends. The board is sized to the
+    # window it starts in.
+    def __init__(self, snakes):
+        self.snakes = snakes
+        super().__init__()
+
+    def make_renderer(self):
+        return ArenaRenderer(ARENA_CELL, BACKGROUND, GRID_COLOR)
+
+    def bake_sprites(self):
+        size = (ARENA_CELL, ARENA_CELL)
+        sprites = {name: (size, (0, 0), lambda surface, color=color: surface.fill(color))
+                   for name, color in (('head', SNAKE_HEAD), ('body', SNAKE_BODY), ('player', PLAYER_COLOR))}
+        for name, food_type in FOOD_TYPES.items():
+            sprites[name] = (size, (0, 0), lambda surface, color=food_type['color']: surface.fill(color))
+        return SpriteAtlas(sprites)
+
+    def reset_game(self):
+        self.inputs.clear()
+        self.arena = ArenaSim(width // ARENA_CELL, height // ARENA_CELL,
+                              food_count=max(1, int(self.snakes * ARENA_FOOD)),
+                              food_points={k: v['points'] for k, v in FOOD_TYPES.items()}, bonus_chance=0.2)
+        self.pilot = ArenaPilot()
+        self.next_id = PLAYER + 1
+        self.died = None  # Tick the player's snake died on
+        self.arena.spawn(PLAYER)
+        self.game_over = False
+        self.paused = False
+        self.renderer.invalidate()
+
+    def update(self):
+        if self.paused:
+            return
+        arena = self.arena
+        if PLAYER in arena.snakes:
+            direction = self.inputs.pop()
+            if direction:
+                arena.turn(PLAYER, direction)
+        elif self.died is None:
+            self.inputs.clear()
+            self.died = arena.ticks
+        elif arena.ticks - self.died >= RESPAWN_TICKS and arena.spawn(PLAYER):
+            self.died = None
+        # Keep the numbers up, the dead are replaced straight away
+        while len(arena.snakes) - (PLAYER in arena.snakes) < self.snakes - 1 and arena.spawn(self.next_id):
+            self.next_id += 1
+        self.pilot.steer(arena, () if self.autopilot is not None else (PLAYER,))
+        arena.step()
+        self.pilot.forget(arena)
+
+    def steer(self, direction):
+        player = self.arena.snakes.get(PLAYER)
+        if player is not None:
+            self.inputs.push(direction, player.direction)
+
+    def handle_resize(self, event):
+        global width, height, screen
+        width, height = event.w, event.h
+        screen = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+        self.renderer.invalidate()
+        self.text.clear()
+
+    def draw(self, alpha=None):
+        overlays = []
+        if fonts_ready():
+            player = self.arena.snakes.get(PLAYER)
+            score = player.score if player is not None else 0
+            score_text = self.text.render(f"Score: {score}  Snakes: {len(self.arena.snakes)}",
+                                          max(20, min(width // 32, height // 24)), TEXT_COLOR)
+            overlays.append(('score', score_text.get_rect(topleft=(10, 10)), None,
+                             lambda: screen.blit(score_text, [10, 10])))
+        self.add_profile(overlays)
+        self.profiler.lap('text')
+        rects = self.renderer.draw(screen, self.arena, self.atlas, overlays, PLAYER)
+        self.profiler.lap('board')
+        pygame.display.update(rects)
+        self.profiler.lap('present')
+        self.inputs.presented()
 
-        pygame.display.update()
 
 def main():
-    game = Game()
+    bootstrap()
+    huge = '--huge' in sys.argv[1:]
+    if '--arena' in sys.argv[1:]:
+        following = sys.argv[sys.argv.index('--arena') + 1:][:1]
+        game = ArenaGame(int(following[0]) if following and following[0].isdigit() else ARENA_SNAKES)
+    else:
+        game = Game(HUGE_BOARD if huge else None)
+    # The autopilot keeps a copy of the whole board, so not on a huge one
+    if '--autopilot' in sys.argv[1:] and not huge:
+        game.autopilot = Autopilot()
+    if '--trace' in sys.argv[1:]:
+        # Record from the start and write a Chrome trace on the way out
+        game.profiler.enable()
+        atexit.register(game.profiler.dump)
+    game.draw()
+    first_frame()
+    # The snake moves SNAKE_SPEED times a second, frames are drawn at RENDER_FPS
+    stepper = FixedStep(SNAKE_SPEED)
 
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
+                print(game.inputs.summary())
+                shutdown()
                 sys.exit()
 
             if event.type == pygame.VIDEORESIZE:
                 game.handle_resize(event)
 
             if event.type == pygame.KEYDOWN:
-                if game.game_over:
+                if event.key == pygame.K_F3:
+                    game.profiler.toggle()
+                elif game.game_over:
                     if event.key == pygame.K_r:
                         game.reset_game()
                     elif event.key == pygame.K_q:
-                        pygame.quit()
+                        print(game.inputs.summary())
+                        shutdown()
                         sys.exit()
                 else:
-                    if event.key == pygame.K_RIGHT and game.snake_direction != 'LEFT':
-                        game.snake_direction = 'RIGHT'
-                    elif event.key == pygame.K_LEFT and game.snake_direction != 'RIGHT':
-                        game.snake_direction = 'LEFT'
-                    elif event.key == pygame.K_UP and game.snake_direction != 'DOWN':
-                        game.snake_direction = 'UP'
-                    elif event.key == pygame.K_DOWN and game.snake_direction != 'UP':
-                        game.snake_direction = 'DOWN'
+                    if event.key == pygame.K_RIGHT:
+                        game.steer('RIGHT')
+                    elif event.key == pygame.K_LEFT:
+                        game.steer('LEFT')
+                    elif event.key == pygame.K_UP:
+                        game.steer('UP')
+                    elif event.key == pygame.K_DOWN:
+                        game.steer('DOWN')
                     elif event.key == pygame.K_p:
                         game.paused = not game.paused
+                    elif event.key == pygame.K_a and not game.huge:
+                        game.autopilot = None if game.autopilot else Autopilot()
+
+        game.profiler.lap('events')
 
-        game.update()
-        game.draw()
-        game.clock.tick(10)
+        ticks = stepper.advance()
+        for _ in range(ticks):
+            game.update()
+        game.profiler.lap('update')
+        game.draw(stepper.alpha)
+        game.clock.tick(RENDER_FPS)
+        game.profiler.lap('wait')
+        game.profiler.end_frame(ticks)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+import time
+
+import pygame
+
+from snake_render import scan_fonts
+
+# Start-up helpers for the pygame front-ends. Nothing runs on import, the
+# games call bootstrap() from main() and only pay for what they use.
+
+# Set to the launching process's time.time() to print the time to the
+# first frame and exit, see snake_startup_bench.py
+STARTUP_BENCH_ENV = 'SNAKE_STARTUP_BENCH'
+
+loaders = []  # Background threads that must finish before pygame.quit()
+mixer_lock = threading.Lock()
+
+
+def init_display(size, caption, flags=0):
+    # Only video and fonts up front, pygame.init() would also bring up
+    # audio, joysticks and the rest before the first frame
+    pygame.display.init()
+    pygame.font.init()
+    scan_fonts()
+    screen = pygame.display.set_mode(size, flags)
+    pygame.display.set_caption(caption)
+    return screen
+
+
+def first_frame():
+    launched = os.environ.get(STARTUP_BENCH_ENV)
+    if launched:
+        print(f'first_frame_ms={(time.time() - float(launched)) * 1000:.1f}')
+        shutdown()
+        sys.exit(0)
+
+
+def shutdown():
+    # pygame.quit() deadlocks if the mixer is still being opened elsewhere
+    for thread in loaders:
+        thread.join()
+    pygame.quit()
+
+
+class Sounds:
+    # Opens the mixer and loads sound files on a background thread. Until
+    # that finishes, or if there is no audio device or file, play() is silent.
+    def __init__(self, files):
+        self.sounds = {}
+        self.thread = threading.Thread(target=self.load, args=(files,), name='sound-loader', daemon=True)
+        self.thread.start()
+        loaders.append(self.thread)
+
+    def load(self, files):
+        with mixer_lock:
+            try:
+                pygame.mixer.init()
+                sounds = {name: pygame.mixer.Sound(path) for name, path in files.items()}
+            except (pygame.error, FileNotFoundError):
+                pygame.mixer.quit()  # Clean up if initialization failed
+                return
+        self.sounds = sounds
+
+    def play(self, name):
+        sound = self.sounds.get(name)
+        if sound is not None:
+            sound.play()
@@ -0,0 +1,203 @@
+import random
+from collections import deque
+
+from snake_core import DIRECTIONS, FOOD_POINTS, FreeCells, changes_course, closest_move
+
+# Many snakes on one board under SnakeSim's rules. Every snake moves at
+# once each tick, and tails have not moved yet when heads do, so running
+# into any body is fatal, and so is two heads arriving on the same cell.
+# All snakes share one FreeCells board, and food is a dict by cell, so a
+# tick costs O(snakes) whatever their lengths.
+#
+# step() leaves what changed in events, as (code, ...) tuples, which is all
+# a client mirroring the board needs after an initial state().
+
+# Event codes
+SPAWN = 0  # (SPAWN, id, direction, cells head first)
+HEAD = 1  # (HEAD, id, cell)
+TAIL = 2  # (TAIL, id), the last cell of the snake is gone
+DEAD = 3  # (DEAD, id), the whole snake is gone
+FOOD = 4  # (FOOD, cell, food type)
+EATEN = 5  # (EATEN, cell)
+SCORE = 6  # (SCORE, id, score)
+
+FOOD_TYPES = ['normal', 'bonus']
+START_LENGTH = 3
+
+
+class Snake:
+    __slots__ = ('id', 'body', 'direction', 'score', 'turns')
+
+    def __init__(self, id, body, direction):
+        self.id = id
+        self.body = body
+        self.direction = direction
+        self.score = 0
+        self.turns = deque()
+
+
+class ArenaSim(FreeCells):
+    def __init__(self, cols, rows, seed=None, food_count=1, food_points=FOOD_POINTS, bonus_chance=0.0):
+        self.cols = cols
+        self.rows = rows
+        self.food_count = food_count
+        self.food_points = food_points
+        self.bonus_chance = bonus_chance
+        self.multiplier = 1
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.clear_cells(cols * rows)
+        self.snakes = {}
+        self.food = {}  # Cell -> food type
+        self.ticks = 0
+        self.events = []
+        self.spawn_food()
+
+    def spawn(self, id, length=START_LENGTH, tries=20):
+        # A new snake for player id somewhere clear, or None when no spot
+        # turned up in a few random tries
+        cols, rows, grid, food = self.cols, self.rows, self.grid, self.food
+        for _ in range(tries):
+            if not self.free:
+                return None
+            head = self.random_free(self.rng)
+            direction = self.rng.choice(list(DIRECTIONS))
+            dx, dy = DIRECTIONS[direction]
+            x, y = head % cols, head // cols
+            cells = []
+            for i in range(length):
+                cx, cy = x - dx * i, y - dy * i
+                cell = cy * cols + cx
+                if not (0 <= cx < cols and 0 <= cy < rows) or grid[cell] or cell in food:
+                    break
+                cells.append(cell)
+            else:
+                snake = self.snakes[id] = Snake(id, deque(cells), direction)
+                for cell in cells:
+                    self.occupy(cell)
+                self.events.append((SPAWN, id, direction, cells))
+                return snake
+        return None
+
+    def remove(self, id):
+        snake = self.snakes.pop(id, None)
+        if snake is not None:
+            for cell in snake.body:
+                self.vacate(cell)
+            self.events.append((DEAD, id))
+
+    def turn(self, id, direction):
+        # Queued like snake_loop.InputQueue, one turn is taken per tick
+        snake = self.snakes.get(id)
+        if snake is None:
+            return False
+        last = snake.turns[-1] if snake.turns else snake.direction
+        if not changes_course(last, direction) or len(snake.turns) >= 3:
+            return False
+        snake.turns.append(direction)
+        return True
+
+    def spawn_food(self):
+        # Top the food back up to food_count on cells clear of bodies
+        food, free = self.food, self.free
+        while len(food) < self.food_count and len(free) > len(food):
+            cell = self.random_free(self.rng)
+            if cell in food:
+                continue
+            food_type = 'normal'
+            if self.bonus_chance and self.rng.random() < self.bonus_chance:
+                food_type = 'bonus'
+            food[cell] = food_type
+            self.events.append((FOOD, cell, food_type))
+
+    def step(self):
+        # Events from spawn() and remove() since the last tick are kept
+        events = self.events
+        self.ticks += 1
+        cols, rows, grid = self.cols, self.rows, self.grid
+        # Where every head is going, checked against the bodies as they
+        # stand before anything moves
+        moves = {}
+        dead = []
+        for snake in self.snakes.values():
+            if snake.turns:
+                snake.direction = snake.turns.popleft()
+            dx, dy = DIRECTIONS[snake.direction]
+            head = snake.body[0]
+            x = head % cols + dx
+            y = head // cols + dy
+            cell = y * cols + x
+            if x >= cols or x < 0 or y >= rows or y < 0 or grid[cell]:
+                dead.append(snake.id)
+            elif cell in moves:
+                # Head-on: both die, and so does anyone else arriving there
+                other = moves[cell]
+                if other is not None:
+                    dead.append(other.id)
+                    moves[cell] = None
+                dead.append(snake.id)
+            else:
+                moves[cell] = snake
+
+        food, points = self.food, self.food_points
+        for cell, snake in moves.items():
+            if snake is None:
+                continue
+            snake.body.appendleft(cell)
+            self.occupy(cell)
+            events.append((HEAD, snake.id, cell))
+            food_type = food.pop(cell, None)
+            if food_type is None:
+                self.vacate(snake.body.pop())
+                events.append((TAIL, snake.id))
+            else:
+                snake.score += points[food_type] * self.multiplier
+                events.append((EATEN, cell))
+                events.append((SCORE, snake.id, snake.score))
+        for id in dead:
+            self.remove(id)
+        self.spawn_food()
+        self.events = []
+        return events
+
+    def state(self):
+        # The whole board as events, for a client starting from nothing
+        events = [(SPAWN, snake.id, snake.direction, list(snake.body)) for snake in self.snakes.values()]
+        events += [(SCORE, snake.id, snake.score) for snake in self.snakes.values() if snake.score]
+        events += [(FOOD, cell, food_type) for cell, food_type in self.food.items()]
+        return events
+
+
+class ArenaPilot:
+    # Steers every snake but the ones in skip: each picks a food to go
+    # after and keeps it until it is gone, and takes whichever free
+    # neighbouring cell is closest to it. O(1) per snake, so a tick of
+    # steering costs O(snakes) like a tick of the arena.
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.targets = {}  # Snake id -> food cell
+
+    def steer(self, arena, skip=()):
+        cols, rows, grid, food = arena.cols, arena.rows, arena.grid, arena.food
+        rng, targets = self.rng, self.targets
+        jitter = rng.random  # Random tie-break
+        choices = None
+        for snake in arena.snakes.values():
+            if snake.id in skip:
+                continue
+            target = targets.get(snake.id)
+            if target not in food:
+                if not food:
+                    continue
+                if choices is None:
+                    choices = list(food)
+                target = targets[snake.id] = choices[rng.randrange(len(choices))]
+            direction = closest_move(cols, rows, grid, snake.body[0], snake.direction, target, jitter)
+            if direction is not None and direction != snake.direction:
+                snake.turns.clear()
+                snake.turns.append(direction)
+
+    def forget(self, arena):
+        # Drop targets of snakes that are gone
+        for id in [id for id in self.targets if id not in arena.snakes]:
+            del self.targets[id]
@@ -0,0 +1,206 @@
+import sys
+import time
+from array import array
+from collections import deque
+
+from snake_core import SnakeSim, DIRECTIONS, OPPOSITE
+from snake_loop import LatencyLog
+
+# An autopilot for SnakeSim: heads for the food along a distance field and
+# only takes moves that leave it a way back to its own tail.
+#
+# The field holds BFS distances from the food around the body as it was
+# when the field was started. It stays usable while the snake follows it:
+# cells the tail gives up only make real paths shorter, and the body grows
+# along the path just walked, uphill of the head. So it is only rebuilt when
+# the food moves, the board is resized or the body leaves the head with no
+# way down. Filling it is spread over ticks, at most `budget` cells a tick,
+# and stops once it reaches the head; until then the snake steers by
+# straight-line distance. The tail check is a flood fill from the next cell
+# that stops as soon as it touches the tail or has found `room` free cells,
+# so its cost follows the snake rather than the board.
+#
+# Internally cells live on the board padded with a one cell wall, which
+# saves every bounds check in the inner loops.
+
+UNSEEN = -1
+
+
+class Autopilot:
+    def __init__(self, budget=500, room=300):
+        self.budget = budget  # Distance field cells filled in per tick
+        self.room = room  # Free cells that count as enough to be safe
+        self.sim = None
+
+    def reset(self, sim):
+        self.sim = sim
+        self.cols = sim.cols
+        self.rows = sim.rows
+        self.width = width = sim.cols + 2
+        self.steps = {direction: dy * width + dx for direction, (dx, dy) in DIRECTIONS.items()}
+        self.target = None
+        self.sync()
+
+    def pad(self, cell):
+        return (cell // self.cols + 1) * self.width + cell % self.cols + 1
+
+    def sync(self):
+        # Rebuild the padded copy of sim.grid
+        cols, width, grid = self.cols, self.width, self.sim.grid
+        self.wall = wall = bytearray(b'\x01') * (width * (self.rows + 2))
+        for y in range(self.rows):
+            start = (y + 1) * width + 1
+            wall[start:start + cols] = grid[y * cols:(y + 1) * cols]
+        self.ticks = self.sim.ticks
+        self.generation = self.sim.generation
+
+    def follow(self):
+        # Bring the padded grid up to date with one tick of movement
+        sim = self.sim
+        if sim.generation != self.generation or not 0 <= sim.ticks - self.ticks <= 1:
+            return self.sync()
+        if sim.ticks == self.ticks:
+            return
+        self.wall[self.pad(sim.body[0])] = 1
+        if sim.vacated is not None:
+            self.wall[self.pad(sim.vacated)] = 0
+        self.ticks = sim.ticks
+
+    def aim(self, target):
+        self.target = target
+        self.dist = array('i', [UNSEEN]) * len(self.wall)
+        self.dist[target] = 0
+        self.seen = bytearray(self.wall)
+        self.seen[target] = 1
+        self.frontier = deque([target])
+        self.last = None  # Field distance of the cell moved into last tick
+
+    def grow(self, budget, goals):
+        # Continue the breadth-first fill from the food until one of the goal
+        # cells is reached. Cells are labelled in order of distance, so the
+        # first goal reached is the closest and every cell nearer the food
+        # than it is labelled already.
+        dist, seen, frontier = self.dist, self.seen, self.frontier
+        width = self.width
+        while frontier and budget > 0:
+            for goal in goals:
+                if dist[goal] != UNSEEN:
+                    return
+            budget -= 1
+            cell = frontier.popleft()
+            d = dist[cell] + 1
+            for n in (cell - 1, cell + 1, cell - width, cell + width):
+                if not seen[n]:
+                    seen[n] = 1
+                    dist[n] = d
+                    frontier.append(n)
+
+    def moves(self):
+        # (rank, direction, cell) for every move that does not die this tick,
+        # best first. Cells the field has not reached yet rank after all the
+        # ones it has, by straight-line distance to the food.
+        sim = self.sim
+        width = self.width
+        size = len(self.wall)
+        head = self.pad(sim.body[0])
+        fx, fy = self.target % width, self.target // width
+        moves = []
+        for direction, step in self.steps.items():
+            cell = head + step
+            if direction == OPPOSITE[sim.direction] or self.wall[cell]:
+                continue
+            d = self.dist[cell]
+            moves.append((d if d != UNSEEN else size + abs(cell % width - fx) + abs(cell // width - fy),
+                          direction, cell))
+        moves.sort()
+        return moves
+
+    def space(self, start, need):
+        # (room, cells) for the free cells reachable from start, counting
+        # until need is met. Reaching the tail counts as unlimited room, it
+        # moves out of the way. cells is the whole region when room < need.
+        wall = self.wall
+        width = self.width
+        tail = self.pad(self.sim.body[-1])
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            for n in (cell - 1, cell + 1, cell - width, cell + width):
+                if n == tail:
+                    return need, seen
+                if n not in seen and not wall[n]:
+                    seen.add(n)
+                    if len(seen) >= need:
+                        return need, seen
+                    queue.append(n)
+        return len(seen), seen
+
+    def choose(self, sim):
+        if sim is not self.sim or sim.cols != self.cols or sim.rows != self.rows:
+            self.reset(sim)
+        self.follow()
+        if sim.food is None:
+            return sim.direction
+        food = (sim.food[1] + 1) * self.width + sim.food[0] + 1
+        if food != self.target:
+            self.aim(food)
+        moves = self.moves()
+        if not moves:
+            return sim.direction
+        size = len(self.wall)
+        if moves[0][0] >= size and self.frontier:
+            self.grow(self.budget, [cell for _, _, cell in moves])
+            moves = self.moves()
+        if (moves[0][0] >= size and not self.frontier or
+                self.last is not None and moves[0][0] >= self.last):
+            # The body has cut the head off from the field, start over and
+            # steer by straight-line distance until it reaches us again
+            self.aim(food)
+            moves = self.moves()
+
+        # The best ranked move that keeps the tail in reach, or failing
+        # that whichever leaves the most room. Moves into a region already
+        # found to be too small are not flooded again.
+        need = min(len(sim) + 1, self.room)
+        best, most, small = moves[0], -1, set()
+        for move in moves:
+            if move[2] in small:
+                continue
+            room, cells = self.space(move[2], need)
+            if room >= need:
+                best = move
+                break
+            small |= cells
+            if room > most:
+                best, most = move, room
+        rank, direction, _ = best
+        self.last = rank if rank < size else None
+        return direction
+
+
+def main():
+    # Per-tick decision times on a large board
+    cols, rows = (int(value) for value in sys.argv[1:3]) if len(sys.argv) > 2 else (200, 200)
+    ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    sim = SnakeSim(cols, rows, seed=1)
+    pilot = Autopilot()
+    times = LatencyLog(ticks)
+    worst = 0.0
+    start = time.perf_counter()
+    while sim.ticks < ticks and not sim.over:
+        before = time.perf_counter()
+        direction = pilot.choose(sim)
+        elapsed = time.perf_counter() - before
+        times.add(elapsed)
+        worst = max(worst, elapsed)
+        sim.turn(direction)
+        sim.step()
+    total = time.perf_counter() - start
+    print(f'{cols}x{rows}: {sim.ticks} ticks, score {sim.score}, length {len(sim)}, {sim.outcome}')
+    print(f'decision p50 {times.percentile(50) * 1000:.3f} ms, p99 {times.percentile(99) * 1000:.3f} ms, '
+          f'max {worst * 1000:.3f} ms, {sim.ticks / total:,.0f} ticks/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import time
+
+import numpy as np
+
+from snake_core import SnakeSim, DIRECTIONS, OPPOSITE, START_CELLS, FOOD_POINTS
+
+# Steps many games in lockstep with the same rules as snake_core.SnakeSim
+# (and so Game.update() in snake-game2.py), holding every board in NumPy
+# arrays. Directions are integer codes in the order of DIRECTION_NAMES.
+
+DIRECTION_NAMES = list(DIRECTIONS)
+DX = np.array([DIRECTIONS[name][0] for name in DIRECTION_NAMES], dtype=np.int32)
+DY = np.array([DIRECTIONS[name][1] for name in DIRECTION_NAMES], dtype=np.int32)
+OPPOSITE_CODE = np.array([DIRECTION_NAMES.index(OPPOSITE[name]) for name in DIRECTION_NAMES], dtype=np.int8)
+
+# Outcome codes returned by BatchSnake.step(), matching SnakeSim outcomes
+NORMAL, ATE, DIED, WON = 0, 1, 2, 3
+OUTCOME_NAMES = ['normal', 'ate', 'died', 'won']
+
+
+class BatchSnake:
+    def __init__(self, games, cols=32, rows=24, seed=None, start=START_CELLS,
+                 direction='RIGHT', food_points=FOOD_POINTS, bonus_chance=0.2, hard=False):
+        self.games = games
+        self.cols = cols
+        self.rows = rows
+        self.size = cols * rows
+        self.start = np.array([y * cols + x for x, y in start], dtype=np.int32)
+        self.start_direction = DIRECTION_NAMES.index(direction)
+        self.points = np.array([food_points['normal'], food_points['bonus']], dtype=np.int32)
+        self.bonus_chance = bonus_chance
+        self.rng = np.random.default_rng(seed)
+        self.index = np.arange(games)
+
+        # The body is a ring buffer per game, body[g, head[g]] is the head
+        # and the previous length[g] - 1 slots (wrapping) are the rest of it
+        self.body = np.zeros((games, self.size), dtype=np.int32)
+        self.head = np.zeros(games, dtype=np.int32)
+        self.length = np.zeros(games, dtype=np.int32)
+        self.occupied = np.zeros((games, self.size), dtype=bool)
+        self.direction = np.zeros(games, dtype=np.int8)
+        self.food = np.zeros(games, dtype=np.int32)
+        self.bonus = np.zeros(games, dtype=bool)
+        self.score = np.zeros(games, dtype=np.int32)
+        self.ticks = np.zeros(games, dtype=np.int32)
+        # Hard mode doubles points, per game so mixed batches are possible
+        self.multiplier = np.where(np.broadcast_to(hard, games), 2, 1).astype(np.int32)
+        # Score and length of the last finished game in each slot
+        self.final_score = np.zeros(games, dtype=np.int32)
+        self.final_length = np.zeros(games, dtype=np.int32)
+        self.reset(np.ones(games, dtype=bool))
+
+    def reset(self, mask):
+        games = self.index[mask]
+        if not len(games):
+            return
+        count = len(self.start)
+        self.occupied[games] = False
+        # Start cells are stored tail first so the head lands in slot count - 1
+        self.body[games[:, None], np.arange(count)] = self.start[::-1]
+        self.occupied[games[:, None], self.start] = True
+        self.head[games] = count - 1
+        self.length[games] = count
+        self.direction[games] = self.start_direction
+        self.score[games] = 0
+        self.ticks[games] = 0
+        self.spawn_food(games)
+
+    def spawn_food(self, games):
+        # Pick the k-th free cell of each board, uniformly over free cells
+        self.bonus[games] = self.rng.random(len(games)) < self.bonus_chance
+        free = ~self.occupied[games]
+        target = (self.rng.random(len(games)) * (self.size - self.length[games])).astype(np.int32)
+        self.food[games] = np.argmax(np.cumsum(free, axis=1) > target[:, None], axis=1)
+
+    def cells(self, game):
+        # Body cells of one game from head to tail as (x, y) tuples
+        slots = (self.head[game] - np.arange(self.length[game])) % self.size
+        return [(int(c) % self.cols, int(c) // self.cols) for c in self.body[game, slots]]
+
+    def step(self, actions):
+        # Turn like SnakeSim.turn(): reversals onto the neck are ignored
+        actions = np.asarray(actions, dtype=np.int8)
+        self.direction = np.where(actions == OPPOSITE_CODE[self.direction], self.direction, actions)
+        self.ticks += 1
+
+        head = self.body[self.index, self.head]
+        x = head % self.cols + DX[self.direction]
+        y = head // self.cols + DY[self.direction]
+        inside = (x >= 0) & (x < self.cols) & (y >= 0) & (y < self.rows)
+        new_head = np.where(inside, y * self.cols + x, 0)
+        # The tail has not moved yet, so running into it is fatal
+        died = ~inside | self.occupied[self.index, new_head]
+        alive = ~died
+
+        moved = self.index[alive]
+        self.head[moved] = (self.head[moved] + 1) % self.size
+        self.body[moved, self.head[moved]] = new_head[moved]
+        self.occupied[moved, new_head[moved]] = True
+
+        ate = alive & (new_head == self.food)
+        self.length[ate] += 1
+        self.score[ate] += self.points[self.bonus[ate].astype(np.intp)] * self.multiplier[ate]
+
+        slid = self.index[alive & ~ate]
+        tail = self.body[slid, (self.head[slid] - self.length[slid]) % self.size]
+        self.occupied[slid, tail] = False
+
+        won = ate & (self.length == self.size)
+        fed = self.index[ate & ~won]
+        if len(fed):
+            self.spawn_food(fed)
+
+        outcome = np.where(ate, ATE, NORMAL).astype(np.int8)
+        outcome[died] = DIED
+        outcome[won] = WON
+        done = died | won
+        self.final_score[done] = self.score[done]
+        self.final_length[done] = self.length[done]
+        self.reset(done)
+        return outcome, done
+
+
+def check_parity(games=64, steps=2000, seed=0):
+    # Replays the batch engine's decisions and food drops on scalar SnakeSims
+    # and fails on the first tick where the two disagree
+    batch = BatchSnake(games, seed=seed, hard=np.arange(games) % 2 == 1)
+    sims = [SnakeSim(batch.cols, batch.rows, seed=seed + g, bonus_chance=0.2) for g in range(games)]
+
+    def sync_food(g):
+        food = int(batch.food[g])
+        sims[g].place_food((food % batch.cols, food // batch.cols), 'bonus' if batch.bonus[g] else 'normal')
+
+    for g, sim in enumerate(sims):
+        sim.multiplier = int(batch.multiplier[g])
+        sync_food(g)
+
+    rng = np.random.default_rng(seed)
+    for tick in range(steps):
+        # Mostly head for the food so games grow and eat bonus food too
+        heads = batch.body[batch.index, batch.head]
+        dx = batch.food % batch.cols - heads % batch.cols
+        dy = batch.food // batch.cols - heads // batch.cols
+        greedy = np.where(dx > 0, 0, np.where(dx < 0, 1, np.where(dy < 0, 2, 3)))
+        actions = np.where(rng.random(games) < 0.8, greedy, rng.integers(0, 4, games))
+
+        outcome, done = batch.step(actions)
+        for g, sim in enumerate(sims):
+            sim.turn(DIRECTION_NAMES[actions[g]])
+            expected = sim.step()
+            if expected != OUTCOME_NAMES[outcome[g]]:
+                raise AssertionError(f'game {g} tick {tick}: {expected} != {OUTCOME_NAMES[outcome[g]]}')
+            if done[g]:
+                if sim.score != batch.final_score[g] or len(sim) != batch.final_length[g]:
+                    raise AssertionError(f'game {g} tick {tick}: final score or length differs')
+                sim.reset()
+                sync_food(g)
+                continue
+            if sim.score != batch.score[g] or list(sim.cells()) != batch.cells(g):
+                raise AssertionError(f'game {g} tick {tick}: score or body differs')
+            if outcome[g] == ATE:
+                sync_food(g)
+    return games * steps
+
+
+def main():
+    ticks = check_parity()
+    print(f'Parity OK over {ticks} game ticks')
+
+    games, steps = 4096, 500
+    batch = BatchSnake(games, seed=1)
+    rng = np.random.default_rng(1)
+    actions = rng.integers(0, 4, (steps, games))
+    start = time.perf_counter()
+    for tick in range(steps):
+        batch.step(actions[tick])
+    elapsed = time.perf_counter() - start
+    print(f'{games} games x {steps} steps: {games * steps / elapsed:,.0f} ticks/sec')
+
+
+if __name__ == '__main__':
+    main()
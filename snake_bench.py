@@ -0,0 +1,312 @@
+import argparse
+import copy
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from snake_arena import ArenaSim, ArenaPilot
+from snake_core import SnakeSim, DIED, WON, OPPOSITE
+from snake_loop import LatencyLog
+
+# Benchmarks for the hot paths: SnakeSim ticks, the collision check and food
+# spawning at fill levels from 10% to 99%, cloning and rolling back long
+# snakes for lookahead search, arena ticks from 1 to 1000 snakes on one
+# board, then update() and draw() of each
+# front-end across window sizes and snake lengths. The front-ends run under
+# SDL's dummy video and audio drivers, one process per game and window size
+# so every run starts from a fresh pygame.
+#
+# Results go to a JSON file keyed by benchmark name. With --baseline, every
+# metric is compared against an earlier file and the run fails if any of
+# them got more than --tolerance worse.
+
+GAMES = {
+    'game1': 'snake-game.py',
+    'game2': 'snake-game2.py',
+    'game3': 'snake-game3.py',
+}
+WINDOW_SIZES = [(640, 480), (1280, 720), (1920, 1080)]
+BOARD_SIZES = [(32, 24), (64, 48), (200, 200)]
+FILLS = [0.05, 0.25, 0.5, 0.9]  # Snake length as a share of the board
+SPAWN_FILLS = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+ALPHAS = [0.0, 1 / 3, 2 / 3]  # Frames drawn per tick, as at 60 FPS and 20 ticks a second
+LOOKAHEADS = [(64, 48, 1000), (200, 200, 1000), (200, 200, 10000)]  # Board and snake length
+DEPTH = 20  # Ticks played out per lookahead
+ARENA_BOARD = (512, 512)
+ARENA_SNAKES = [1, 10, 100, 1000]
+# Metrics where bigger numbers are better, every other one is a time
+THROUGHPUT = ('ticks_per_sec', 'ops_per_sec', 'clones_per_sec', 'deepcopies_per_sec')
+
+
+class CycleWalk:
+    # Steers the snake around a Hamiltonian cycle of the board (right along
+    # the rows from column 1 in a zigzag, then back up column 0), so it never
+    # dies and any length fits. Works as a Game.autopilot too.
+    def __init__(self, cols, rows):
+        if rows % 2:
+            raise ValueError('the cycle needs an even number of rows')
+        order = []
+        for y in range(rows):
+            xs = range(1, cols) if y % 2 == 0 else range(cols - 1, 0, -1)
+            order += [y * cols + x for x in xs]
+        order += [y * cols for y in range(rows - 1, -1, -1)]
+        self.cols = cols
+        self.order = order
+        self.next = {}
+        for i, cell in enumerate(order):
+            after = order[(i + 1) % len(order)]
+            step = after - cell
+            self.next[cell] = {1: 'RIGHT', -1: 'LEFT', cols: 'DOWN', -cols: 'UP'}[step]
+
+    def place(self, sim, length):
+        # Start over with a snake of `length` cells on the cycle, head first
+        cells = [(cell % self.cols, cell // self.cols) for cell in reversed(self.order[:length])]
+        sim.reset()
+        sim.build(cells)
+        sim.direction = self.next[self.order[length - 2]]
+        sim.food, sim.food_type = sim.spawn_food()
+
+    def choose(self, sim):
+        return self.next[sim.body[0]]
+
+
+def rate(count, seconds):
+    return count / max(seconds, 1e-9)
+
+
+def percentiles(log):
+    return {f'p{p}_ms': round(log.percentile(p) * 1000, 4) for p in (50, 95, 99)}
+
+
+def bench_tick(cols, rows, fill, ticks=20000):
+    sim = SnakeSim(cols, rows, seed=1)
+    walk = CycleWalk(cols, rows)
+    length = max(3, int(cols * rows * fill))
+    walk.place(sim, length)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        sim.turn(walk.choose(sim))
+        if sim.step() == WON:
+            walk.place(sim, length)  # Eating fills the board sooner or later
+    return {'ticks_per_sec': round(rate(ticks, time.perf_counter() - start))}
+
+
+def bench_collision(cols, rows, fill, count=100000):
+    # Head turned back into its own neck, the check is all that runs
+    sim = SnakeSim(cols, rows, seed=1)
+    CycleWalk(cols, rows).place(sim, max(3, int(cols * rows * fill)))
+    sim.direction = OPPOSITE[sim.direction]
+    start = time.perf_counter()
+    for _ in range(count):
+        sim.over = False
+        if sim.step() != DIED:
+            raise AssertionError('collision benchmark did not collide')
+    return {'ops_per_sec': round(rate(count, time.perf_counter() - start))}
+
+
+def bench_spawn(cols, rows, fill, count=100000):
+    sim = SnakeSim(cols, rows, seed=1)
+    CycleWalk(cols, rows).place(sim, int(cols * rows * fill))
+    start = time.perf_counter()
+    for _ in range(count):
+        sim.spawn_food()
+    return {'ops_per_sec': round(rate(count, time.perf_counter() - start))}
+
+
+def bench_lookahead(cols, rows, length, count=2000):
+    # The two ways a search can play ahead: a clone() per line played out,
+    # or snapshot() and restore() on one sim. ticks_per_sec counts ticks
+    # played and undone. copy.deepcopy is there for comparison.
+    sim = SnakeSim(cols, rows, seed=1)
+    walk = CycleWalk(cols, rows)
+    walk.place(sim, length)
+    start = time.perf_counter()
+    for _ in range(count):
+        sim.clone()
+    clones = rate(count, time.perf_counter() - start)
+    deepcopies = max(1, count // 20)
+    start = time.perf_counter()
+    for _ in range(deepcopies):
+        copy.deepcopy(sim)
+    deepcopies = rate(deepcopies, time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(count):
+        mark = sim.snapshot()
+        for _ in range(DEPTH):
+            sim.turn(walk.choose(sim))
+            sim.step()
+        sim.restore(mark)
+    ticks = rate(count * DEPTH, time.perf_counter() - start)
+    return {'clones_per_sec': round(clones), 'deepcopies_per_sec': round(deepcopies), 'ticks_per_sec': round(ticks)}
+
+
+def bench_arena(snakes, ticks=300):
+    # ArenaSim.step() alone, with ArenaPilot steering and the dead replaced
+    # so the count holds. us_per_snake should stay flat as snakes grows.
+    cols, rows = ARENA_BOARD
+    arena = ArenaSim(cols, rows, seed=1, food_count=max(1, snakes // 2), bonus_chance=0.2)
+    pilot = ArenaPilot(seed=1)
+    next_id = 0
+    elapsed = 0.0
+    for _ in range(ticks):
+        while len(arena.snakes) < snakes and arena.spawn(next_id):
+            next_id += 1
+        pilot.steer(arena)
+        start = time.perf_counter()
+        arena.step()
+        elapsed += time.perf_counter() - start
+        pilot.forget(arena)
+    return {'ticks_per_sec': round(rate(ticks, elapsed)),
+            'us_per_snake': round(elapsed / ticks / snakes * 1e6, 3)}
+
+
+def load_game(script, size, dirty):
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(script))[0], script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    width, height = size
+    if hasattr(module, 'bootstrap'):
+        module.width, module.height = width, height
+        module.DIRTY_RECTS = dirty
+        module.bootstrap()
+        game = module.Game()
+        game.selecting_speed = False
+        return game, game.update
+    module.WIDTH, module.HEIGHT = width, height
+    game = module.SnakeGame()
+    return game, game.update_snake
+
+
+def bench_frontend(script, size, dirty, ticks=120):
+    # One process per call, see main(). update() and draw() are timed on
+    # their own while the snake walks the cycle at each fill level.
+    game, update = load_game(script, size, dirty)
+    sim = game.sim
+    sim.record = None  # Placing the snake restarts the game, which a replay cannot follow
+    walk = CycleWalk(sim.cols, sim.rows)
+    game.autopilot = walk
+    results = {}
+    for fill in FILLS:
+        walk.place(sim, max(3, int(sim.cols * sim.rows * fill)))
+        if hasattr(game, 'renderer'):
+            game.renderer.invalidate()
+        game.draw(0.0)
+        updates = LatencyLog(ticks)
+        frames = LatencyLog(ticks * len(ALPHAS))
+        for _ in range(ticks):
+            start = time.perf_counter()
+            update()
+            updates.add(time.perf_counter() - start)
+            for alpha in ALPHAS:
+                start = time.perf_counter()
+                game.draw(alpha)
+                frames.add(time.perf_counter() - start)
+        total = sum(updates.samples)
+        results[f'{fill:.2f}'] = {
+            'update': {'ticks_per_sec': round(rate(ticks, total)), **percentiles(updates)},
+            'draw': percentiles(frames),
+        }
+    return results
+
+
+def run_frontend(script, size, dirty):
+    env = dict(os.environ)
+    env.setdefault('SDL_VIDEODRIVER', 'dummy')
+    env.setdefault('SDL_AUDIODRIVER', 'dummy')
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.abspath(__file__), '--frontend', os.path.join(here, script),
+               '%dx%d' % size, 'dirty' if dirty else 'full']
+    result = subprocess.run(command, env=env, cwd=here, capture_output=True, text=True, timeout=600)
+    if result.returncode:
+        raise RuntimeError(f'{script} {size} failed:\n{result.stderr}')
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def run_all(quick):
+    results = {}
+
+    def record(name, metrics):
+        results[name] = metrics
+        print(name, ' '.join(f'{key}={value}' for key, value in metrics.items()), flush=True)
+
+    boards = BOARD_SIZES[:1] if quick else BOARD_SIZES
+    for cols, rows in boards:
+        for fill in FILLS:
+            record(f'tick/{cols}x{rows}/fill{fill:.2f}', bench_tick(cols, rows, fill))
+        record(f'collision/{cols}x{rows}', bench_collision(cols, rows, 0.5))
+        for fill in SPAWN_FILLS:
+            record(f'spawn/{cols}x{rows}/fill{fill:.2f}', bench_spawn(cols, rows, fill))
+    for cols, rows, length in LOOKAHEADS[:1] if quick else LOOKAHEADS:
+        record(f'lookahead/{cols}x{rows}/len{length}', bench_lookahead(cols, rows, length))
+    for snakes in ARENA_SNAKES:
+        record(f'arena/{ARENA_BOARD[0]}x{ARENA_BOARD[1]}/snakes{snakes}', bench_arena(snakes))
+
+    sizes = WINDOW_SIZES[:1] if quick else WINDOW_SIZES
+    variants = [(name, script, True) for name, script in GAMES.items()]
+    # The dirty rectangle renderers can also repaint everything, for comparison
+    variants += [(name + '-full', script, False) for name, script in GAMES.items() if name != 'game1']
+    for name, script, dirty in variants:
+        for size in sizes:
+            for fill, metrics in run_frontend(script, size, dirty).items():
+                for part, values in metrics.items():
+                    record(f'{part}/{name}/{size[0]}x{size[1]}/fill{fill}', values)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Prints every metric that moved by more than tolerance, returns the
+    # number that got worse
+    worse = 0
+    for name, metrics in results.items():
+        for key, value in metrics.items():
+            old = baseline.get(name, {}).get(key)
+            if not old or not value:
+                continue
+            change = value / old - 1
+            if key not in THROUGHPUT:
+                change = -change  # Times get worse by going up
+            if abs(change) > tolerance:
+                slower = change < 0
+                worse += slower
+                print(f'{"WORSE" if slower else "better"} {name} {key}: {old} -> {value} ({change:+.0%})')
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the snake simulation and front-ends')
+    parser.add_argument('-o', '--out', default='bench.json', help='where to write the results')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown, 0.1 is 10%%')
+    parser.add_argument('--quick', action='store_true', help='smallest board and window only')
+    parser.add_argument('--frontend', nargs=3, metavar=('SCRIPT', 'SIZE', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.frontend:
+        script, size, mode = args.frontend
+        size = tuple(int(value) for value in size.split('x'))
+        print(json.dumps(bench_frontend(script, size, mode == 'dirty')))
+        return 0
+
+    import pygame
+    results = run_all(args.quick)
+    with open(args.out, 'w') as f:
+        json.dump({
+            'meta': {'python': platform.python_version(), 'pygame': pygame.version.ver,
+                     'machine': platform.machine(), 'time': int(time.time())},
+            'results': results,
+        }, f, indent=1)
+    print(f'{len(results)} results written to {args.out}')
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = compare(results, json.load(f)['results'], args.tolerance)
+        print(f'{worse} metrics more than {args.tolerance:.0%} worse than {args.baseline}')
+        return 1 if worse else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
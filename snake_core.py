@@ -0,0 +1,473 @@
+import random
+from array import array
+from collections import deque
+
+# Pure-Python snake rules shared by every front-end. Nothing in here touches
+# pygame, so games can be stepped headless as fast as the CPU allows.
+
+# Outcomes returned by SnakeSim.step()
+NORMAL = 'normal'
+ATE = 'ate'
+DIED = 'died'
+WON = 'won'  # The snake filled the board, there is nowhere left for food
+
+DIRECTIONS = {
+    'RIGHT': (1, 0),
+    'LEFT': (-1, 0),
+    'UP': (0, -1),
+    'DOWN': (0, 1),
+}
+OPPOSITE = {'RIGHT': 'LEFT', 'LEFT': 'RIGHT', 'UP': 'DOWN', 'DOWN': 'UP'}
+
+START_CELLS = ((5, 2), (4, 2), (3, 2))
+FOOD_POINTS = {'normal': 1, 'bonus': 3}
+# Ticks per second for each difficulty in snake-game2.py
+DIFFICULTY_SPEEDS = {'easy': 8, 'normal': 12, 'hard': 16}
+CHUNK = 16  # Side of the square chunks SparseSnakeSim indexes the body by
+TURN = 'turn'  # Undo log entry for a change of direction
+# Plain values copied as they are by SnakeSim.clone()
+SCALARS = ('cols', 'rows', 'start', 'start_direction', 'food_points', 'bonus_chance', 'multiplier', 'seed',
+           'vacated', 'direction', 'score', 'ticks', 'over', 'outcome', 'food', 'food_type', 'generation')
+
+
+def changes_course(last, direction):
+    # Whether turning to direction after last can matter: the same one
+    # again is a no-op and the opposite one a fatal U-turn
+    return direction != last and direction != OPPOSITE[last]
+
+
+def closest_move(cols, rows, grid, head, direction, target, jitter=None):
+    # The direction onto whichever free neighbour of packed cell head is
+    # closest to target, never back onto the neck, or None when there is
+    # none. jitter(), when given, is added to each distance to break ties.
+    x, y = head % cols, head // cols
+    tx, ty = target % cols, target // cols
+    back = OPPOSITE[direction]
+    best = None
+    for name, (dx, dy) in DIRECTIONS.items():
+        nx, ny = x + dx, y + dy
+        if name == back or not (0 <= nx < cols and 0 <= ny < rows) or grid[ny * cols + nx]:
+            continue
+        distance = abs(nx - tx) + abs(ny - ty)
+        if jitter is not None:
+            distance += jitter()
+        if best is None or distance < best[0]:
+            best = (distance, name)
+    return None if best is None else best[1]
+
+
+class FreeCells:
+    # Board occupancy for SnakeSim and snake_arena.ArenaSim. grid has a byte
+    # per cell, set while the cell is taken, so collisions are O(1). Free
+    # cells sit in a list with each cell's index kept in slot, so they can
+    # be swap-removed and sampled uniformly in O(1) as well.
+    __slots__ = ()
+
+    def clear_cells(self, size):
+        self.grid = bytearray(size)
+        self.free = list(range(size))
+        self.slot = array('i', range(size))
+
+    def random_free(self, rng):
+        return self.free[rng.randrange(len(self.free))]
+
+    def occupy(self, cell):
+        # Returns where the cell was in free, for unoccupy()
+        self.grid[cell] = 1
+        index = self.slot[cell]
+        last = self.free.pop()
+        if last != cell:
+            self.free[index] = last
+            self.slot[last] = index
+        self.slot[cell] = -1
+        return index
+
+    def vacate(self, cell):
+        self.grid[cell] = 0
+        self.slot[cell] = len(self.free)
+        self.free.append(cell)
+
+    def unoccupy(self, cell, index):
+        # Undo occupy(cell), putting free back in exactly the same order so
+        # food spawns the same way again
+        self.grid[cell] = 0
+        free = self.free
+        if index == len(free):
+            free.append(cell)
+        else:
+            last = free[index]
+            free[index] = cell
+            self.slot[last] = len(free)
+            free.append(last)
+        self.slot[cell] = index
+
+    def unvacate(self, cell):
+        # Undo vacate(cell), which left it at the end of free
+        self.grid[cell] = 1
+        self.free.pop()
+        self.slot[cell] = -1
+
+
+class SnakeSim(FreeCells):
+    __slots__ = SCALARS + ('rng', 'record', 'log', 'marks', 'grid', 'free', 'slot', 'body')
+
+    def __init__(self, cols, rows, seed=None, start=START_CELLS,
+                 direction='RIGHT', food_points=FOOD_POINTS, bonus_chance=0.0):
+        self.cols = cols
+        self.rows = rows
+        self.start = start
+        self.start_direction = direction
+        self.food_points = food_points
+        self.bonus_chance = bonus_chance
+        self.multiplier = 1  # Hard mode doubles points
+        # Every game gets its own seeded RNG so it can be replayed exactly
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        # Optional snake_replay.Replay logging turns and resizes. Lookahead
+        # under a snapshot() is not part of the game and is not recorded.
+        self.record = None
+        self.log = None  # Undo log while a snapshot() is live, see restore()
+        self.marks = None  # Log length at each live snapshot, outermost first
+        # Bumped whenever the board changes other than by one step: build(),
+        # so reset() and resize(), and restore(). Anything following the sim
+        # tick by tick starts over when it changes.
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        self.build(self.start)
+        self.direction = self.start_direction
+        self.score = 0
+        self.ticks = 0
+        self.over = False
+        self.outcome = NORMAL
+        self.food, self.food_type = self.spawn_food()
+
+    def build(self, cells):
+        # The body is a deque of packed cell ids (y * cols + x), head first,
+        # mirrored in the FreeCells grid
+        self.clear_cells(self.cols * self.rows)
+        self.body = deque()
+        self.vacated = None  # Tail cell given up by the last tick, for interpolation
+        for x, y in cells:
+            cell = y * self.cols + x
+            self.body.append(cell)
+            self.occupy(cell)
+        self.generation += 1
+
+    def spawn_food(self):
+        if not self.free:
+            return None, None
+        food_type = 'normal'
+        if self.bonus_chance and self.rng.random() < self.bonus_chance:
+            food_type = 'bonus'
+        cell = self.random_free(self.rng)
+        return (cell % self.cols, cell // self.cols), food_type
+
+    def place_food(self, pos, food_type='normal'):
+        self.food = tuple(pos)
+        self.food_type = food_type
+
+    @property
+    def head(self):
+        cell = self.body[0]
+        return cell % self.cols, cell // self.cols
+
+    def __len__(self):
+        return len(self.body)
+
+    def cells(self):
+        # Body cells from head to tail as (x, y) tuples
+        cols = self.cols
+        for cell in self.body:
+            yield cell % cols, cell // cols
+
+    def turn(self, direction):
+        # Ignore reversals onto the neck, like the keyboard handlers do
+        if direction != OPPOSITE[self.direction]:
+            if direction != self.direction:
+                if self.log is not None:
+                    self.log.append((TURN, self.direction))
+                elif self.record is not None:
+                    self.record.turn(self.ticks, direction)
+            self.direction = direction
+
+    def step(self):
+        if self.over:
+            return self.outcome
+        if self.record is not None and self.log is None and self.multiplier != self.record.multiplier:
+            self.record.set_multiplier(self.ticks, self.multiplier)
+        self.ticks += 1
+        dx, dy = DIRECTIONS[self.direction]
+        cols = self.cols
+        head = self.body[0]
+        x = head % cols + dx
+        y = head // cols + dy
+        head = y * cols + x
+        # The tail has not moved yet, so running into it is fatal
+        if x >= cols or x < 0 or y >= self.rows or y < 0 or self.grid[head]:
+            if self.log is not None:
+                self.log.append((DIED,))
+            return self.end(DIED)
+        self.body.appendleft(head)
+        index = self.occupy(head)
+
+        if (x, y) == self.food:
+            if self.log is not None:
+                self.log.append((ATE, head, index, self.vacated, self.score, self.food, self.food_type,
+                                 self.rng.getstate()))
+            self.score += self.food_points[self.food_type] * self.multiplier
+            self.food, self.food_type = self.spawn_food()
+            self.vacated = None
+            if self.food is None:
+                return self.end(WON)
+            return ATE
+        tail = self.body.pop()
+        if self.log is not None:
+            self.log.append((NORMAL, head, index, tail, self.vacated))
+        self.vacated = tail
+        self.vacate(tail)
+        return NORMAL
+
+    def end(self, outcome):
+        self.over = True
+        self.outcome = outcome
+        return outcome
+
+    def resize(self, cols, rows):
+        if self.record is not None:
+            self.record.resize(self.ticks, cols, rows)
+        # Never shrink the board below the snake, it would cut the body off
+        cells = list(self.cells())
+        self.cols = max(cols, max(x for x, _ in cells) + 1)
+        self.rows = max(rows, max(y for _, y in cells) + 1)
+        self.build(cells)
+        if self.food is None or self.food[0] >= self.cols or self.food[1] >= self.rows:
+            self.food, self.food_type = self.spawn_food()
+
+    # Lookahead. A search can either clone() the sim and play the copy out,
+    # or play the sim itself from a snapshot() and restore() it afterwards.
+    # Taking a snapshot is O(1): it starts an undo log of the turns and
+    # steps that follow, and restoring undoes them in reverse, so both cost
+    # as many steps as were taken and nothing for the length of the snake.
+    # build(), reset() and resize() are not logged, so clone() around those.
+
+    def clone(self):
+        # An independent copy without the replay or undo log. Its RNG is in
+        # the same state, so it spawns the same food.
+        sim = object.__new__(type(self))
+        for name in SCALARS:
+            setattr(sim, name, getattr(self, name))
+        sim.rng = random.Random()
+        sim.rng.setstate(self.rng.getstate())
+        sim.record = None
+        sim.log = None
+        sim.marks = None
+        sim.body = deque(self.body)
+        self.copy_board(sim)
+        return sim
+
+    def copy_board(self, sim):
+        sim.grid = self.grid[:]
+        sim.free = self.free[:]
+        sim.slot = self.slot[:]
+
+    def snapshot(self):
+        # Returns a token for restore(). Snapshots nest: each token counts
+        # the snapshots live once it is taken.
+        if self.log is None:
+            self.log = []
+            self.marks = []
+        self.marks.append(len(self.log))
+        return len(self.marks)
+
+    def restore(self, token):
+        # Back to the state snapshot() returned token in. Snapshots taken
+        # since then are gone, it and earlier ones can still be restored.
+        # Restoring the outermost one ends them all and stops logging.
+        if self.log is None or not 0 < token <= len(self.marks):
+            raise ValueError('no such snapshot')
+        mark = self.marks[token - 1]
+        del self.marks[token:]
+        log = self.log
+        body = self.body
+        if len(log) > mark:
+            self.generation += 1
+        while len(log) > mark:
+            entry = log.pop()
+            kind = entry[0]
+            if kind == TURN:
+                self.direction = entry[1]
+                continue
+            self.ticks -= 1
+            self.over = False
+            self.outcome = NORMAL
+            if kind == DIED:
+                continue
+            if kind == NORMAL:
+                _, head, index, tail, self.vacated = entry
+                self.unvacate(tail)
+                body.append(tail)
+            else:
+                _, head, index, self.vacated, self.score, self.food, self.food_type, state = entry
+                self.rng.setstate(state)
+            body.popleft()
+            self.unoccupy(head, index)
+        if token == 1:
+            self.log = self.marks = None
+
+
+class CellSet(set):
+    # Occupied cells of a sparse board, read like SnakeSim.grid: grid[cell]
+    # is true when the cell is taken
+    __slots__ = ()
+    __getitem__ = set.__contains__
+
+
+class SparseSnakeSim(SnakeSim):
+    # SnakeSim for boards far too big for per-cell arrays; 10,000 x 10,000
+    # is 10^8 cells. Occupancy is a set and food is placed by rejection
+    # sampling, which takes few tries while the snake covers a small share
+    # of the board. The body is also indexed by CHUNK x CHUNK chunks, so a
+    # renderer can find the segments in view without walking the snake.
+    # Memory follows the length of the snake, not the size of the board.
+    __slots__ = ('flips', 'chunks', 'chunk_cols')
+
+    def __init__(self, cols, rows, **kwargs):
+        # Set flips to a list to be told (chunk, +1 or -1) as chunks fill
+        # and empty, until generation changes
+        self.flips = None
+        super().__init__(cols, rows, **kwargs)
+
+    def build(self, cells):
+        self.grid = CellSet()
+        self.chunks = {}  # Chunk id -> occupied cells in it
+        self.chunk_cols = -(-self.cols // CHUNK)
+        self.body = deque()
+        self.vacated = None
+        for x, y in cells:
+            cell = y * self.cols + x
+            self.body.append(cell)
+            self.occupy(cell)
+        self.generation += 1
+        if self.flips is not None:
+            self.flips.clear()
+
+    def chunk(self, cell):
+        return cell // self.cols // CHUNK * self.chunk_cols + cell % self.cols // CHUNK
+
+    def occupy(self, cell):
+        self.grid.add(cell)
+        key = self.chunk(cell)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = set()
+            if self.flips is not None:
+                self.flips.append((key, 1))
+        chunk.add(cell)
+
+    def vacate(self, cell):
+        self.grid.discard(cell)
+        key = self.chunk(cell)
+        chunk = self.chunks[key]
+        chunk.discard(cell)
+        if not chunk:
+            del self.chunks[key]
+            if self.flips is not None:
+                self.flips.append((key, -1))
+
+    def unoccupy(self, cell, index):
+        self.vacate(cell)
+
+    def unvacate(self, cell):
+        self.occupy(cell)
+
+    def copy_board(self, sim):
+        sim.grid = CellSet(self.grid)
+        sim.chunks = {key: set(cells) for key, cells in self.chunks.items()}
+        sim.chunk_cols = self.chunk_cols
+        sim.flips = None
+
+    def spawn_food(self):
+        size = self.cols * self.rows
+        if len(self.grid) >= size:
+            return None, None
+        food_type = 'normal'
+        if self.bonus_chance and self.rng.random() < self.bonus_chance:
+            food_type = 'bonus'
+        cell = self.rng.randrange(size)
+        while cell in self.grid:
+            cell = self.rng.randrange(size)
+        return (cell % self.cols, cell // self.cols), food_type
+
+    def visible(self, x0, y0, x1, y1):
+        # Body cells with x0 <= x < x1 and y0 <= y < y1, from the chunks
+        # overlapping that rectangle only
+        cols = self.cols
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, cols), min(y1, self.rows)
+        cells = []
+        for cy in range(y0 // CHUNK, (y1 - 1) // CHUNK + 1):
+            for cx in range(x0 // CHUNK, (x1 - 1) // CHUNK + 1):
+                for cell in self.chunks.get(cy * self.chunk_cols + cx, ()):
+                    if x0 <= cell % cols < x1 and y0 <= cell // cols < y1:
+                        cells.append(cell)
+        return cells
+
+
+def sim_state(sim):
+    # Everything restore() has to put back, for check_undo()
+    state = {name: getattr(sim, name) for name in SCALARS if name != 'generation'}
+    state['body'] = list(sim.body)
+    state['rng'] = sim.rng.getstate()
+    if isinstance(sim, SparseSnakeSim):
+        state['grid'] = set(sim.grid)
+        state['chunks'] = {key: set(cells) for key, cells in sim.chunks.items()}
+    else:
+        state['grid'] = bytes(sim.grid)
+        state['free'] = list(sim.free)
+        state['slot'] = list(sim.slot)
+    return state
+
+
+def check_undo(games=200, seed=0):
+    # Plays random lookahead on both sims, with snapshots nested several
+    # deep, several taken before any move, and restored in any order, and
+    # fails on the first restore() that does not give back the state its
+    # snapshot was taken in. Returns the number of restores checked.
+    rng = random.Random(seed)
+    restores = 0
+    for game in range(games):
+        cls = SparseSnakeSim if game % 2 else SnakeSim
+        sim = cls(rng.randint(6, 14), rng.randint(6, 14), seed=seed + game, bonus_chance=0.3)
+        while not sim.over:
+            live = []  # (token, state) of the snapshots not yet gone
+            for _ in range(rng.randint(1, 40)):
+                action = rng.random()
+                if action < 0.3:
+                    live.append((sim.snapshot(), sim_state(sim)))
+                elif action < 0.45 and live:
+                    index = rng.randrange(len(live))
+                    token, state = live[index]
+                    sim.restore(token)
+                    restores += 1
+                    if sim_state(sim) != state:
+                        raise AssertionError(f'game {game}: snapshot {token} restored wrong')
+                    del live[index if index == 0 else index + 1:]
+                else:
+                    sim.turn(rng.choice(list(DIRECTIONS)))
+                    sim.step()
+            if live:
+                token, state = live[0]
+                sim.restore(token)
+                restores += 1
+                if sim_state(sim) != state or sim.log is not None:
+                    raise AssertionError(f'game {game}: outermost snapshot restored wrong')
+            for _ in range(3):
+                sim.turn(rng.choice(list(DIRECTIONS)))
+                sim.step()
+    return restores
+
+
+if __name__ == '__main__':
+    print(f'Undo OK over {check_undo()} restores')
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import deque
+
+from snake_arena import ArenaSim, SPAWN, HEAD, TAIL, DEAD, FOOD, EATEN, SCORE
+from snake_core import FOOD_POINTS
+from snake_loop import LatencyLog
+from snake_server import ArenaServer, SYNC, decode_frame, read_frame
+
+# Headless players for snake_server.py. Every client turns at random and
+# counts the bytes and frames it gets. Frame arrival jitter is how far the
+# gaps between frames stray from the tick interval.
+#
+# Decoding every frame on every client would take far more CPU than the
+# server does, so only --mirrors of the clients decode the deltas and keep
+# a copy of the board. --slow clients stop reading for seconds at a time,
+# to show the server skipping them and resyncing them later.
+#
+# Without --connect the server runs in this process on a free port, and at
+# the end every mirror is checked against the server's board.
+
+
+class Mirror:
+    # A client's copy of the board, kept up to date from frames
+    def __init__(self):
+        self.snakes = {}
+        self.scores = {}
+        self.food = {}
+        self.id = None
+        self.tick = 0
+
+    def apply(self, payload):
+        kind, tick, id, _, events = decode_frame(payload)
+        if kind == SYNC:
+            self.__init__()
+            self.id = id
+        self.tick = tick
+        for event in events:
+            code = event[0]
+            if code == HEAD:
+                self.snakes[event[1]].appendleft(event[2])
+            elif code == TAIL:
+                self.snakes[event[1]].pop()
+            elif code == SPAWN:
+                self.snakes[event[1]] = deque(event[3])
+            elif code == DEAD:
+                self.snakes.pop(event[1], None)
+                self.scores.pop(event[1], None)
+            elif code == FOOD:
+                self.food[event[1]] = event[2]
+            elif code == EATEN:
+                del self.food[event[1]]
+            elif code == SCORE:
+                self.scores[event[1]] = event[2]
+
+    def matches(self, arena):
+        return (self.snakes == {id: snake.body for id, snake in arena.snakes.items()} and
+                self.food == arena.food and
+                self.scores == {id: snake.score for id, snake in arena.snakes.items() if snake.score})
+
+
+class Stats:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.jitter = LatencyLog(100000)
+        self.bytes = 0
+        self.frames = 0
+        self.syncs = 0
+        self.connected = 0
+
+
+async def player(host, port, stats, rng, turn_chance, mirror=None, slow=False):
+    reader, writer = await asyncio.open_connection(host, port)
+    stats.connected += 1
+    loop = asyncio.get_running_loop()
+    last = None
+    try:
+        while True:
+            if slow and rng.random() < 0.02:
+                await asyncio.sleep(rng.uniform(1.0, 3.0))
+                last = None
+            payload = await read_frame(reader)
+            now = loop.time()
+            if last is not None:
+                stats.jitter.add(abs(now - last - stats.interval))
+            last = now
+            stats.bytes += len(payload)
+            stats.frames += 1
+            stats.syncs += payload[0] == SYNC
+            if mirror is not None:
+                mirror.apply(payload)
+            if rng.random() < turn_chance:
+                writer.write(bytes([rng.randrange(4)]))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run(args):
+    server = None
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        port = int(port)
+    else:
+        cols, rows = (int(value) for value in args.size.split('x'))
+        arena = ArenaSim(cols, rows, seed=args.seed, food_count=args.food, food_points=FOOD_POINTS,
+                         bonus_chance=0.2)
+        server = ArenaServer(arena, args.rate)
+        host = '127.0.0.1'
+        port = await server.listen(host, 0)
+        ticker = asyncio.ensure_future(server.run(report=False))
+
+    stats = Stats(args.rate)
+    rng = random.Random(args.seed)
+    mirrors = [Mirror() for _ in range(min(args.mirrors, args.clients))]
+    tasks = []
+    for i in range(args.clients):
+        mirror = mirrors[i] if i < len(mirrors) else None
+        slow = i >= args.clients - args.slow
+        tasks.append(asyncio.ensure_future(player(host, port, stats, random.Random(rng.random()),
+                                                  args.turn_chance, mirror, slow)))
+        if i % 50 == 49:
+            await asyncio.sleep(0)  # Let the connections through in batches
+    start = time.perf_counter()
+    await asyncio.sleep(args.seconds)
+    elapsed = time.perf_counter() - start
+
+    ok = True
+    if server is not None:
+        ticker.cancel()
+        # The mirrors are a tick behind until the last frame is read
+        await asyncio.sleep(0.2)
+        synced = [mirror for mirror in mirrors if mirror.tick == server.arena.ticks]
+        ok = all(mirror.matches(server.arena) for mirror in synced)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    ticks = elapsed * args.rate
+    print(f'{stats.connected} clients for {elapsed:.1f}s: {stats.frames:,} frames, {stats.syncs} syncs')
+    print(f'{stats.bytes / max(stats.frames, 1):,.0f} bytes/frame, {stats.bytes / ticks:,.0f} bytes/tick '
+          f'over all clients')
+    print(f'frame jitter p50 {stats.jitter.percentile(50) * 1000:.2f} ms, '
+          f'p99 {stats.jitter.percentile(99) * 1000:.2f} ms')
+    if server is not None:
+        print(server.stats(server.arena.ticks, server.sent))
+        print(f'{len(synced)} of {len(mirrors)} mirrors checked: {"match" if ok else "MISMATCH"}')
+        server.server.close()
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test snake_server.py with headless players')
+    parser.add_argument('-n', '--clients', type=int, default=300)
+    parser.add_argument('--connect', metavar='HOST:PORT', help='default: run a server in this process')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--mirrors', type=int, default=5, help='clients that decode frames')
+    parser.add_argument('--slow', type=int, default=0, help='clients that stall on reading')
+    parser.add_argument('--turn-chance', type=float, default=0.2, help='chance of a turn per frame')
+    parser.add_argument('--size', default='128x128', help='board of the in-process server')
+    parser.add_argument('--rate', type=int, default=12)
+    parser.add_argument('--food', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
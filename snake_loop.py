@@ -0,0 +1,110 @@
+import math
+import time
+from array import array
+from collections import deque
+
+from snake_core import changes_course
+
+# Game loop helpers shared by the pygame front-ends.
+
+RENDER_FPS = 60
+
+
+class FixedStep:
+    # Turns elapsed wall time into whole simulation ticks at `rate` per
+    # second, independent of how often frames are drawn. alpha is how far
+    # the next tick has progressed, for interpolated drawing. After a stall
+    # at most max_ticks run at once and the rest of the backlog is dropped,
+    # so the game briefly slows down instead of fast-forwarding.
+    def __init__(self, rate, max_ticks=5, clock=time.perf_counter):
+        self.rate = rate
+        self.max_ticks = max_ticks
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.last = self.clock()
+        self.accumulator = 0.0
+        self.alpha = 0.0
+
+    def advance(self):
+        now = self.clock()
+        self.accumulator += now - self.last
+        self.last = now
+        step = 1.0 / self.rate
+        ticks = int(self.accumulator // step)
+        if ticks > self.max_ticks:
+            ticks = self.max_ticks
+            self.accumulator = ticks * step
+        self.accumulator -= ticks * step
+        self.alpha = min(self.accumulator / step, 1.0)
+        return ticks
+
+
+class LatencyLog:
+    # The last `size` samples in a preallocated ring, in seconds
+    def __init__(self, size=1024):
+        self.samples = array('d', bytes(8 * size))
+        self.size = size
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples[self.count % self.size] = seconds
+        self.count += 1
+
+    def percentile(self, p):
+        samples = sorted(self.samples[:min(self.count, self.size)])
+        if not samples:
+            return 0.0
+        return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+
+class InputQueue:
+    # Buffers turns between ticks so quick double taps are not lost. Each
+    # tick takes exactly one turn. A press is dropped when it repeats or
+    # reverses the last queued direction (or the current one when nothing
+    # is queued), since it could only be a no-op or a fatal U-turn.
+    #
+    # Latency is measured from reading the KEYDOWN to the tick that applies
+    # it, and to the first display update after that tick.
+    def __init__(self, size=3):
+        self.size = size
+        self.turns = deque()
+        self.unseen = []
+        self.applied = LatencyLog()
+        self.pixels = LatencyLog()
+        self.dropped = 0
+
+    def push(self, direction, current, now=None):
+        last = self.turns[-1][0] if self.turns else current
+        if not changes_course(last, direction) or len(self.turns) >= self.size:
+            self.dropped += 1
+            return False
+        self.turns.append((direction, time.perf_counter() if now is None else now))
+        return True
+
+    def pop(self, now=None):
+        if not self.turns:
+            return None
+        direction, pressed = self.turns.popleft()
+        self.applied.add((time.perf_counter() if now is None else now) - pressed)
+        self.unseen.append(pressed)
+        return direction
+
+    def presented(self, now=None):
+        if self.unseen:
+            now = time.perf_counter() if now is None else now
+            for pressed in self.unseen:
+                self.pixels.add(now - pressed)
+            self.unseen.clear()
+
+    def clear(self):
+        self.turns.clear()
+        self.unseen.clear()
+
+    def summary(self):
+        return ('Input latency ms (n={}, dropped {}): applied p50 {:.1f} p99 {:.1f}, '
+                'pixels p50 {:.1f} p99 {:.1f}').format(
+                    self.applied.count, self.dropped,
+                    self.applied.percentile(50) * 1000, self.applied.percentile(99) * 1000,
+                    self.pixels.percentile(50) * 1000, self.pixels.percentile(99) * 1000)
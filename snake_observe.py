@@ -0,0 +1,214 @@
+import ctypes
+import random
+import sys
+import time
+
+import numpy as np
+import pygame
+
+from snake_core import SnakeSim, FOOD_POINTS
+from snake_render import DirtyRenderer, SpriteAtlas
+
+# Observations of a SnakeSim for training agents, either the board as a
+# (rows, cols, channels) grid or the frame a renderer draws, as NumPy
+# arrays. Both are views of buffers that are updated in place, so taking an
+# observation copies nothing: copy it to keep it past the next one.
+#
+# Nothing here opens a window. SnakeEnv wraps a sim with either observer
+# and a frame skip, for training loops.
+
+CHANNELS = ('head', 'body', 'food', 'bonus')
+HEAD, BODY, FOOD, BONUS = range(len(CHANNELS))
+FOOD_CHANNELS = {'normal': FOOD, 'bonus': BONUS}
+# The snake-game3.py look
+PALETTE = {
+    'background': (40, 44, 52),
+    'grid': (58, 64, 74),
+    'head': (85, 181, 199),
+    'body': (85, 181, 199),
+    'normal': (249, 38, 114),
+    'bonus': (253, 151, 31),
+}
+
+
+def continues(sim, ticks, generation):
+    # Whether sim is where it was at `ticks` or one step on from there, and
+    # has not been rebuilt or restored since
+    return sim.generation == generation and 0 <= sim.ticks - ticks <= 1
+
+
+class GridObserver:
+    # One byte per cell and channel. Each tick only the old and new head,
+    # the vacated tail and the food are touched, like Autopilot.follow();
+    # anything else (a reset, a restore(), skipped ticks) rebuilds it.
+    def __init__(self):
+        self.sim = None
+
+    def reset(self, sim):
+        self.sim = sim
+        self.cols = sim.cols
+        self.rows = sim.rows
+        self.grid = np.zeros((sim.rows, sim.cols, len(CHANNELS)), np.uint8)
+        self.cells = self.grid.reshape(-1, len(CHANNELS))  # The same memory, by packed cell id
+        self.sync()
+
+    def sync(self):
+        sim, cells = self.sim, self.cells
+        cells.fill(0)
+        body = np.fromiter(sim.body, np.intp, len(sim))
+        cells[body[1:], BODY] = 1
+        cells[body[0], HEAD] = 1
+        self.food = None
+        self.place_food()
+        self.head = body[0]
+        self.ticks = sim.ticks
+        self.generation = sim.generation
+
+    def place_food(self):
+        sim, cells = self.sim, self.cells
+        food = sim.food, sim.food_type
+        if food == self.food:
+            return
+        if self.food is not None and self.food[0] is not None:
+            (x, y), food_type = self.food
+            cells[y * self.cols + x, FOOD_CHANNELS[food_type]] = 0
+        if sim.food is not None:
+            x, y = sim.food
+            cells[y * self.cols + x, FOOD_CHANNELS[sim.food_type]] = 1
+        self.food = food
+
+    def observe(self, sim):
+        if sim is not self.sim or sim.cols != self.cols or sim.rows != self.rows:
+            self.reset(sim)
+            return self.grid
+        head = sim.body[0]
+        if not continues(sim, self.ticks, self.generation):
+            self.sync()
+        elif sim.ticks != self.ticks:
+            if head != self.head:
+                cells = self.cells
+                cells[self.head, HEAD] = 0
+                cells[self.head, BODY] = 1
+                cells[head, HEAD] = 1
+                if sim.vacated is not None:
+                    cells[sim.vacated, BODY] = 0
+                self.head = head
+            self.place_food()
+            self.ticks = sim.ticks
+        return self.grid
+
+
+def pixel_view(surface):
+    # (height, width, 3) RGB view straight onto a 32-bit surface's pixels.
+    # surfarray.pixels3d() locks the surface for as long as its array lives,
+    # and nothing can be blitted to a locked surface, so the view is made
+    # from the pixel address instead. The ctypes buffer is the array's base
+    # and holds the surface, so the pixels live as long as any view of them.
+    if surface.get_bytesize() != 4:
+        raise ValueError('pixel views need a 32-bit surface')
+    width, height = surface.get_size()
+    pitch = surface.get_pitch()
+    memory = (ctypes.c_uint8 * (pitch * height)).from_address(surface._pixels_address)
+    memory.surface = surface
+    pixels = np.ndarray((height, width, 4), np.uint8, memory, strides=(pitch, 4, 1))
+    shifts = tuple(shift // 8 for shift in surface.get_shifts()[:3])
+    if shifts == (2, 1, 0):
+        return pixels[..., 2::-1]
+    if shifts == (0, 1, 2):
+        return pixels[..., :3]
+    raise ValueError(f'unsupported pixel layout {surface.get_shifts()}')
+
+
+class PixelObserver:
+    # The board drawn offscreen by a DirtyRenderer, so a tick redraws a few
+    # cells. With scale > 1 the frame is shrunk by that factor into a
+    # second surface and the view is of that one.
+    def __init__(self, cols, rows, cell_size=20, scale=1, palette=PALETTE):
+        size = (cols * cell_size, rows * cell_size)
+        self.cell_size = cell_size
+        self.palette = palette
+        self.surface = pygame.Surface(size, 0, 32)
+        self.renderer = DirtyRenderer(cell_size, palette['background'], palette['grid'])
+        self.renderer.resize(size)
+        cell = (cell_size, cell_size)
+        self.atlas = SpriteAtlas({name: (cell, (0, 0), lambda surface, color=palette[name]: surface.fill(color))
+                                  for name in ('head', 'body', 'normal', 'bonus')})
+        self.target = self.surface
+        if scale > 1:
+            self.target = pygame.Surface((size[0] // scale, size[1] // scale), 0, 32)
+        self.pixels = pixel_view(self.target)
+        self.sim = None
+
+    def observe(self, sim):
+        if sim is not self.sim or not continues(sim, self.ticks, self.generation):
+            self.sim = sim
+            self.renderer.invalidate()
+        self.ticks = sim.ticks
+        self.generation = sim.generation
+        overlays = []
+        if sim.food is not None:
+            x, y = sim.food
+            sprite = self.atlas.place(sim.food_type, x, y, self.cell_size)
+            overlays.append(('food', pygame.Rect(sprite[1], sprite[2].size), (sim.food, sim.food_type),
+                             lambda: self.surface.blit(*sprite)))
+        self.renderer.draw(self.surface, sim, self.atlas, overlays)
+        if self.target is not self.surface:
+            pygame.transform.scale(self.surface, self.target.get_size(), self.target)
+        return self.pixels
+
+
+class SnakeEnv:
+    # A headless game under the snake-game2.py rules. step() applies a turn
+    # and then runs `skip` ticks, stopping early when the game ends, and
+    # returns (observation, reward, done) with the points scored as reward.
+    def __init__(self, cols=32, rows=24, seed=None, observe='grid', skip=1, cell_size=20, scale=1,
+                 bonus_chance=0.2):
+        self.cols = cols
+        self.rows = rows
+        self.skip = skip
+        self.bonus_chance = bonus_chance
+        self.rng = random.Random(seed)
+        if observe == 'grid':
+            self.observer = GridObserver()
+        elif observe == 'pixels':
+            self.observer = PixelObserver(cols, rows, cell_size, scale)
+        else:
+            raise ValueError(f'unknown observation {observe!r}')
+        self.sim = None
+
+    def reset(self):
+        self.sim = SnakeSim(self.cols, self.rows, seed=self.rng.getrandbits(63), food_points=FOOD_POINTS,
+                            bonus_chance=self.bonus_chance)
+        return self.observer.observe(self.sim)
+
+    def step(self, direction):
+        sim = self.sim
+        sim.turn(direction)
+        score = sim.score
+        for _ in range(self.skip):
+            sim.step()
+            if sim.over:
+                break
+        return self.observer.observe(sim), sim.score - score, sim.over
+
+
+def main():
+    # Observations per second while a greedy policy plays
+    from snake_tournament import greedy
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for observe, skip, scale in [('grid', 1, 1), ('grid', 4, 1), ('pixels', 1, 1), ('pixels', 4, 1),
+                                 ('pixels', 1, 4)]:
+        env = SnakeEnv(seed=1, observe=observe, skip=skip, scale=scale)
+        observation = env.reset()
+        start = time.perf_counter()
+        for _ in range(steps):
+            observation, _, done = env.step(greedy(env.sim))
+            if done:
+                observation = env.reset()
+        elapsed = time.perf_counter() - start
+        print(f'{observe} {"x".join(map(str, observation.shape))} skip {skip}: '
+              f'{steps / elapsed:,.0f} observations/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import json
+import math
+import os
+import time
+from array import array
+
+import pygame
+
+# Frame phase timings for the pygame front-ends.
+#
+# The main loop calls lap(phase) as each phase of a frame finishes, which
+# charges the time since the previous lap to that phase. Samples go into
+# fixed-size rings preallocated per phase, so recording allocates nothing,
+# and while the profiler is disabled lap() returns straight away. The
+# overlay shows rolling p50/p99 per phase and the achieved frame and tick
+# rates, and dump() writes the rings as a Chrome trace (chrome://tracing or
+# ui.perfetto.dev).
+
+TRACE_PATH = 'snake-trace.json'
+
+
+class FrameProfiler:
+    def __init__(self, phases, size=600, clock=time.perf_counter):
+        self.names = list(phases)
+        self.index = {name: i for i, name in enumerate(phases)}
+        self.size = size
+        self.clock = clock
+        self.starts = array('d', bytes(8 * size * len(phases)))
+        self.durations = array('d', bytes(8 * size * len(phases)))
+        self.counts = array('q', bytes(8 * len(phases)))
+        # Frame end times and the ticks run in each frame, for the rates
+        self.frames = array('d', bytes(8 * size))
+        self.frame_ticks = array('q', bytes(8 * size))
+        self.frame_count = 0
+        self.enabled = False
+        self.last = clock()
+        self.shown = 0.0
+        self.surface = None
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        self.last = self.clock()
+
+    def toggle(self):
+        self.enable(not self.enabled)
+
+    def lap(self, phase):
+        if not self.enabled:
+            return
+        now = self.clock()
+        i = self.index[phase]
+        slot = i * self.size + self.counts[i] % self.size
+        self.starts[slot] = self.last
+        self.durations[slot] = now - self.last
+        self.counts[i] += 1
+        self.last = now
+
+    def end_frame(self, ticks):
+        if not self.enabled:
+            return
+        slot = self.frame_count % self.size
+        self.frames[slot] = self.last
+        self.frame_ticks[slot] = ticks
+        self.frame_count += 1
+
+    def percentile(self, phase, p):
+        i = self.index[phase]
+        count = min(self.counts[i], self.size)
+        if not count:
+            return 0.0
+        samples = sorted(self.durations[i * self.size:i * self.size + count])
+        return samples[max(0, math.ceil(p / 100 * count) - 1)]
+
+    def rates(self):
+        # Frames and ticks per second over the frames in the ring
+        count = min(self.frame_count, self.size)
+        if count < 2:
+            return 0.0, 0.0
+        newest = (self.frame_count - 1) % self.size
+        oldest = (self.frame_count - count) % self.size
+        span = self.frames[newest] - self.frames[oldest]
+        if span <= 0:
+            return 0.0, 0.0
+        ticks = sum(self.frame_ticks[:count]) - self.frame_ticks[oldest]
+        return (count - 1) / span, ticks / span
+
+    def render(self, font, color, target_fps, target_ticks, every=0.5):
+        # The overlay, rebuilt at most every `every` seconds so reading the
+        # numbers does not itself show up in them
+        now = self.clock()
+        if self.surface is None or now - self.shown >= every:
+            fps, ticks = self.rates()
+            lines = [f'fps {fps:5.1f}/{target_fps}  ticks {ticks:5.1f}/{target_ticks}']
+            lines += [f'{name:<8} p50 {self.percentile(name, 50) * 1000:6.2f}  '
+                      f'p99 {self.percentile(name, 99) * 1000:6.2f} ms' for name in self.names]
+            rendered = [font.render(line, True, color) for line in lines]
+            height = font.get_linesize()
+            self.surface = pygame.Surface((max(s.get_width() for s in rendered), height * len(rendered)),
+                                          pygame.SRCALPHA)
+            self.surface.fill((0, 0, 0, 160))
+            for row, line in enumerate(rendered):
+                self.surface.blit(line, (0, row * height))
+            self.shown = now
+        return self.surface
+
+    def dump(self, path=TRACE_PATH):
+        # Complete ('X') events for every sample still in the rings, in
+        # microseconds as the trace format wants
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'main loop'}}]
+        for i, name in enumerate(self.names):
+            for slot in range(i * self.size, i * self.size + min(self.counts[i], self.size)):
+                events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': 0,
+                               'ts': self.starts[slot] * 1e6, 'dur': self.durations[slot] * 1e6})
+        events.sort(key=lambda event: event.get('ts', 0))
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
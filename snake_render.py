@@ -0,0 +1,418 @@
+import threading
+from array import array
+from collections import OrderedDict
+
+import pygame
+
+from snake_core import CHUNK
+
+# Rendering helpers shared by the pygame front-ends.
+
+font_scan = None
+
+
+def scan_fonts():
+    # The first SysFont() call scans every installed font (fc-list on
+    # Linux). Start that on a thread so it overlaps with opening the window.
+    global font_scan
+    if font_scan is None:
+        font_scan = threading.Thread(target=pygame.sysfont.get_fonts, name='font-scan', daemon=True)
+        font_scan.start()
+
+
+def fonts_ready():
+    return font_scan is None or not font_scan.is_alive()
+
+
+def bake_background(size, color, grid_color, grid_size):
+    # The grid never changes, so draw it once and blit it from then on
+    surface = pygame.Surface(size)
+    surface.fill(color)
+    width, height = size
+    for x in range(0, width, grid_size):
+        pygame.draw.line(surface, grid_color, (x, 0), (x, height))
+    for y in range(0, height, grid_size):
+        pygame.draw.line(surface, grid_color, (0, y), (width, y))
+    return surface
+
+
+class TextCache:
+    # SysFont does a system font lookup and render() rasterizes the glyphs,
+    # so keep both around. Fonts are keyed by (name, size) and rendered
+    # surfaces by (font, text, color), each with LRU eviction.
+    def __init__(self, max_fonts=8, max_surfaces=64):
+        self.max_fonts = max_fonts
+        self.max_surfaces = max_surfaces
+        self.fonts = OrderedDict()
+        self.surfaces = OrderedDict()
+
+    def font(self, size, name='arial'):
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            if font_scan is not None:
+                font_scan.join()
+            font = self.fonts[key] = pygame.font.SysFont(name, size)
+            if len(self.fonts) > self.max_fonts:
+                self.fonts.popitem(last=False)
+        else:
+            self.fonts.move_to_end(key)
+        return font
+
+    def render(self, text, size, color, name='arial'):
+        key = (name, size, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = self.font(size, name).render(text, True, color)
+            if len(self.surfaces) > self.max_surfaces:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def clear(self):
+        self.fonts.clear()
+        self.surfaces.clear()
+
+
+class SpriteAtlas:
+    # Paints every sprite once into a single surface so a frame is nothing
+    # but blits from it. sprites maps a name to (size, offset, paint), where
+    # paint(surface) draws the sprite at (0, 0) and offset places it relative
+    # to the top-left corner of its cell.
+    def __init__(self, sprites):
+        width = sum(size[0] for size, _, _ in sprites.values())
+        height = max(size[1] for size, _, _ in sprites.values())
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.sprites = {}
+        x = 0
+        for name, (size, offset, paint) in sprites.items():
+            area = pygame.Rect((x, 0), size)
+            paint(self.surface.subsurface(area))
+            self.sprites[name] = (area, offset)
+            x += size[0]
+        if pygame.display.get_surface() is not None:
+            self.surface = self.surface.convert_alpha()
+
+    def place(self, name, x, y, cell_size, origin=(0, 0)):
+        # One (source, dest, area) entry for screen.blit() or screen.blits(),
+        # with origin the board pixel shown at the top-left of the screen
+        area, (dx, dy) = self.sprites[name]
+        return self.surface, (x * cell_size + dx - origin[0], y * cell_size + dy - origin[1]), area
+
+    def places(self, name, cells, cell_size, origin=(0, 0)):
+        area, (dx, dy) = self.sprites[name]
+        dx -= origin[0]
+        dy -= origin[1]
+        surface = self.surface
+        return [(surface, (x * cell_size + dx, y * cell_size + dy), area) for x, y in cells]
+
+
+def paint_glow(surface, color, radius, layers, alpha):
+    # Same look as blitting `layers` concentric circles of the given alpha on
+    # top of each other: a ring covered by k of them ends up with alpha
+    # 1 - (1 - alpha)^k, so paint each ring once with that value.
+    center = (surface.get_width() // 2, surface.get_height() // 2)
+    for k in range(1, layers + 1):
+        combined = round(255 * (1 - (1 - alpha / 255) ** k))
+        pygame.draw.circle(surface, (*color, combined), center, radius + layers - k + 1)
+
+
+def interpolate(sim, alpha):
+    # Head and tail sprites `alpha` of the way through the last tick, as
+    # (sprite, cell, x, y) with x and y in fractional cells. The cells they
+    # are heading into are left out of the static body while they move.
+    if sim.over or len(sim) < 2:
+        return []
+    cols = sim.cols
+    body = sim.body
+
+    def lerp(name, src, dst):
+        x, y = src % cols, src // cols
+        return (name, dst, x + (dst % cols - x) * alpha, y + (dst // cols - y) * alpha)
+
+    moving = [lerp('head', body[1], body[0])]
+    if sim.vacated is not None:
+        moving.append(lerp('body', sim.vacated, body[-1]))
+    return moving
+
+
+class DirtyRenderer:
+    # Redraws only the board cells that changed since the last frame and
+    # returns their rects for pygame.display.update(rects).
+    #
+    # Snake segments are the atlas 'head' and 'body' sprites and must fit
+    # inside their cell. Anything else (food glow, HUD text) is an overlay:
+    # (name, rect, key, draw). An overlay is redrawn when its key or rect
+    # changes, and whenever a cell under it is dirty all of its cells are
+    # restored first so it is never blended twice. With an interpolation
+    # alpha the moving head and tail are handled as overlays too.
+    def __init__(self, cell_size, color, grid_color):
+        self.cell_size = cell_size
+        self.color = color
+        self.grid_color = grid_color
+        self.background = None
+        self.full = True
+
+    def resize(self, size):
+        self.background = bake_background(size, self.color, self.grid_color, self.cell_size)
+        self.full = True
+
+    def invalidate(self):
+        self.full = True
+
+    def cells_under(self, rect):
+        size = self.cell_size
+        return {(x, y)
+                for x in range(max(rect.left, 0) // size, max(rect.right - 1, 0) // size + 1)
+                for y in range(max(rect.top, 0) // size, max(rect.bottom - 1, 0) // size + 1)}
+
+    def draw(self, screen, sim, atlas, overlays, alpha=None):
+        moving = [] if alpha is None else interpolate(sim, alpha)
+        skip = {cell for _, cell, _, _ in moving}
+        movers = []
+        for name, cell, x, y in moving:
+            surface, (px, py), area = atlas.place(name, x, y, self.cell_size)
+            dest = (round(px), round(py))
+            movers.append(('moving_' + name, pygame.Rect(dest, area.size), dest,
+                           lambda surface=surface, dest=dest, area=area: screen.blit(surface, dest, area)))
+        overlays = movers + overlays
+
+        if self.full or sim.cols != self.cols or not 0 <= sim.ticks - self.ticks <= 1:
+            rects = self.redraw(screen, sim, atlas, overlays, skip)
+        else:
+            rects = self.update(screen, sim, atlas, overlays, skip)
+        self.full = False
+        self.cols = sim.cols
+        self.ticks = sim.ticks
+        self.head = sim.body[0]
+        self.tail = sim.body[-1]
+        self.skip = skip
+        self.overlays = {name: (rect, key) for name, rect, key, _ in overlays}
+        return rects
+
+    def redraw(self, screen, sim, atlas, overlays, skip):
+        screen.blit(self.background, (0, 0))
+        cols = sim.cols
+        cells = iter(sim.body)
+        head = next(cells)
+        segments = atlas.places('head', [(head % cols, head // cols)] if head not in skip else [],
+                                self.cell_size)
+        segments += atlas.places('body', [(cell % cols, cell // cols) for cell in cells if cell not in skip],
+                                 self.cell_size)
+        screen.blits(segments, doreturn=False)
+        for _, _, _, draw in overlays:
+            draw()
+        return [screen.get_rect()]
+
+    def update(self, screen, sim, atlas, overlays, skip):
+        cols = sim.cols
+        dirty = set()
+        if sim.ticks != self.ticks:
+            # The old head changes color, the new head appears and the old
+            # tail cell is either vacated or still body after eating
+            for cell in (self.head, sim.body[0], self.tail, sim.body[-1]):
+                dirty.add((cell % cols, cell // cols))
+        # Cells whose static segment is hidden behind a moving sprite
+        for cell in skip ^ self.skip:
+            dirty.add((cell % cols, cell // cols))
+
+        areas = []
+        for name, rect, key, draw in overlays:
+            cells = self.cells_under(rect)
+            shown = self.overlays.get(name)
+            if shown != (rect, key):
+                dirty |= cells
+                if shown is not None:
+                    dirty |= self.cells_under(shown[0])
+            areas.append((cells, draw))
+        current = {name for name, _, _, _ in overlays}
+        for name, (rect, _) in self.overlays.items():
+            if name not in current:
+                dirty |= self.cells_under(rect)
+        # Grow the dirty set until every touched overlay is fully restored
+        grown = True
+        while grown:
+            grown = False
+            for cells, _ in areas:
+                if cells & dirty and not cells <= dirty:
+                    dirty |= cells
+                    grown = True
+
+        if not dirty:
+            return []
+        size = self.cell_size
+        head = sim.body[0]
+        rects = []
+        for x, y in dirty:
+            rect = pygame.Rect(x * size, y * size, size, size)
+            screen.blit(self.background, rect, rect)
+            rects.append(rect)
+        segments = []
+        for x, y in dirty:
+            if 0 <= x < cols and 0 <= y < sim.rows:
+                cell = y * cols + x
+                if sim.grid[cell] and cell not in skip:
+                    segments.append(atlas.place('head' if cell == head else 'body', x, y, size))
+        screen.blits(segments, doreturn=False)
+        for cells, draw in areas:
+            if cells & dirty:
+                draw()
+        return rects
+
+
+class ViewportRenderer:
+    # Draws a board far bigger than the window through a camera that follows
+    # the head, for snake_core.SparseSnakeSim. Only what is on screen is
+    # touched. The grid is one blit of a baked tile, and segments in view
+    # come from the sim's chunk index. The minimap is updated from the
+    # chunks that filled or emptied since the last frame. So a frame costs
+    # the same on any board and at any length.
+    #
+    # Same draw() interface as DirtyRenderer, except that food is drawn here
+    # and overlays are in screen coordinates. The whole window is redrawn
+    # every frame because the camera moves.
+    def __init__(self, cell_size, color, grid_color, snake_color, food_color, minimap=160):
+        self.cell_size = cell_size
+        self.color = color
+        self.grid_color = grid_color
+        self.snake_color = snake_color
+        self.food_color = food_color
+        self.minimap_width = minimap
+        self.background = None
+        self.sim = None
+        self.full = True
+
+    def resize(self, size):
+        # One cell bigger than the window, so it can be shifted by the
+        # camera's position within a cell
+        width, height = size
+        self.background = bake_background((width + self.cell_size, height + self.cell_size),
+                                          self.color, self.grid_color, self.cell_size)
+        self.full = True
+
+    def invalidate(self):
+        self.full = True
+
+    def follow(self, sim):
+        # Bring the minimap up to date. Each pixel counts the non-empty
+        # chunks under it and shows the snake while that is above zero.
+        if sim is not self.sim or sim.generation != self.generation:
+            self.sim = sim
+            self.generation = sim.generation
+            width = self.minimap_width
+            height = max(1, round(width * sim.rows / sim.cols))
+            self.minimap = pygame.Surface((width, height))
+            self.minimap.fill(self.color)
+            self.counts = array('i', bytes(4 * width * height))
+            sim.flips = []
+            flips = [(key, 1) for key in sim.chunks]
+        else:
+            flips = sim.flips
+        width, height = self.minimap.get_size()
+        for key, delta in flips:
+            x = key % sim.chunk_cols * CHUNK * width // sim.cols
+            y = key // sim.chunk_cols * CHUNK * height // sim.rows
+            pixel = y * width + x
+            self.counts[pixel] += delta
+            if self.counts[pixel] == (1 if delta > 0 else 0):
+                self.minimap.set_at((x, y), self.snake_color if delta > 0 else self.color)
+        sim.flips.clear()
+
+    def draw(self, screen, sim, atlas, overlays, alpha=None):
+        size = self.cell_size
+        width, height = screen.get_size()
+        moving = [] if alpha is None else interpolate(sim, alpha)
+        head_x, head_y = (moving[0][2], moving[0][3]) if moving else sim.head
+        # Keep the head in the middle of the window, but not past the edges
+        left = min(max(round((head_x + 0.5) * size - width / 2), 0), max(sim.cols * size - width, 0))
+        top = min(max(round((head_y + 0.5) * size - height / 2), 0), max(sim.rows * size - height, 0))
+        origin = (left, top)
+        screen.blit(self.background, (-(left % size), -(top % size)))
+
+        skip = {cell for _, cell, _, _ in moving}
+        head = sim.body[0]
+        cols = sim.cols
+        cells = sim.visible(left // size, top // size, (left + width) // size + 1, (top + height) // size + 1)
+        segments = atlas.places('body', [(cell % cols, cell // cols) for cell in cells
+                                         if cell != head and cell not in skip], size, origin)
+        if head not in skip:
+            segments.append(atlas.place('head', head % cols, head // cols, size, origin))
+        for name, _, x, y in moving:
+            surface, (x, y), area = atlas.place(name, x, y, size, origin)
+            segments.append((surface, (round(x), round(y)), area))
+        if sim.food is not None:
+            segments.append(atlas.place(sim.food_type, *sim.food, size, origin))
+        screen.blits(segments, doreturn=False)
+
+        for _, _, _, draw in overlays:
+            draw()
+        self.draw_minimap(screen, sim, origin)
+        self.full = False
+        return [screen.get_rect()]
+
+    def draw_minimap(self, screen, sim, origin):
+        self.follow(sim)
+        width, height = self.minimap.get_size()
+        x0, y0 = screen.get_width() - width - 10, 10
+        screen.blit(self.minimap, (x0, y0))
+        board_width, board_height = sim.cols * self.cell_size, sim.rows * self.cell_size
+        view = pygame.Rect(x0 + origin[0] * width // board_width, y0 + origin[1] * height // board_height,
+                           max(2, screen.get_width() * width // board_width),
+                           max(2, screen.get_height() * height // board_height))
+        pygame.draw.rect(screen, self.grid_color, (x0 - 1, y0 - 1, width + 2, height + 2), 1)
+        pygame.draw.rect(screen, self.snake_color, view, 1)
+        if sim.food is not None:
+            x, y = sim.food
+            pygame.draw.rect(screen, self.food_color, (x0 + x * width // sim.cols - 1,
+                                                       y0 + y * height // sim.rows - 1, 3, 3))
+
+
+class ArenaRenderer:
+    # Every snake of a snake_arena.ArenaSim, the one with id `player` in
+    # the atlas 'player' sprite and the rest in 'head' and 'body', plus the
+    # food. Hundreds of snakes change too many cells a tick for dirty rects
+    # to pay, so the board is repainted into its own surface once a tick
+    # and each frame is a single blit of that. Overlays are in screen
+    # coordinates and drawn every frame.
+    def __init__(self, cell_size, color, grid_color):
+        self.cell_size = cell_size
+        self.color = color
+        self.grid_color = grid_color
+        self.background = None
+        self.full = True
+
+    def resize(self, size):
+        # The board keeps its size, only a new arena changes it
+        self.full = True
+
+    def invalidate(self):
+        self.full = True
+
+    def draw(self, screen, arena, atlas, overlays, player=None):
+        size = self.cell_size
+        if self.background is None or self.background.get_size() != (arena.cols * size, arena.rows * size):
+            self.background = bake_background((arena.cols * size, arena.rows * size), self.color,
+                                              self.grid_color, size)
+            self.board = self.background.copy()
+            self.full = True
+        if self.full or arena.ticks != self.ticks:
+            self.board.blit(self.background, (0, 0))
+            cols = arena.cols
+            segments = []
+            for snake in arena.snakes.values():
+                head, body = ('player', 'player') if snake.id == player else ('head', 'body')
+                cells = iter(snake.body)
+                cell = next(cells)
+                segments.append(atlas.place(head, cell % cols, cell // cols, size))
+                segments += atlas.places(body, [(cell % cols, cell // cols) for cell in cells], size)
+            for cell, food_type in arena.food.items():
+                segments.append(atlas.place(food_type, cell % cols, cell // cols, size))
+            self.board.blits(segments, doreturn=False)
+            self.ticks = arena.ticks
+        screen.fill(self.color)
+        screen.blit(self.board, (0, 0))
+        for _, _, _, draw in overlays:
+            draw()
+        self.full = False
+        return [screen.get_rect()]
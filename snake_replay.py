@@ -0,0 +1,255 @@
+import argparse
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from snake_core import SnakeSim, DIRECTIONS, NORMAL, ATE, DIED, WON
+
+# Compact replays of SnakeSim games and a headless verifier for them.
+#
+# A replay is the magic b'SNR', a version byte and then unsigned LEB128
+# varints: seed, cols, rows, speed, bonus chance in per-mille, normal and
+# bonus points, multiplier, start direction, the start cells as a count and
+# x, y pairs, and the final ticks, score and outcome. The rest of the file
+# is events, each (tick delta << 3 | code) followed by its arguments. Codes
+# 0-3 are turns, RESIZE carries cols and rows and MULTIPLIER the new value.
+# A turn usually fits in a single byte.
+#
+# Games hand finished replays to a ReplayWriter, which does the file work on
+# a background thread like ScoreStore.
+
+MAGIC = b'SNR'
+VERSION = 1
+DIRECTION_NAMES = list(DIRECTIONS)
+DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTION_NAMES)}
+RESIZE = 4
+MULTIPLIER = 5
+OUTCOMES = [NORMAL, ATE, DIED, WON]
+REPLAY_DIR = 'replays'
+# Replays are read from files anyone could have written, so boards are
+# held to what a window could show: 1024 cells is a 20480-pixel side at
+# the games' 20-pixel cells
+MAX_SIDE = 1024
+
+
+def write_varint(out, value):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class Replay:
+    # Attach to a fresh SnakeSim before its first step; the sim reports
+    # every turn, resize and multiplier change through record
+    def __init__(self, sim, speed=0):
+        self.seed = sim.seed
+        self.cols = sim.cols
+        self.rows = sim.rows
+        self.speed = speed
+        self.bonus_chance = sim.bonus_chance
+        self.food_points = sim.food_points
+        self.start_multiplier = self.multiplier = sim.multiplier
+        self.start_direction = sim.start_direction
+        self.start = sim.start
+        self.events = bytearray()
+        self.last_tick = 0
+        sim.record = self
+
+    def event(self, tick, code, *args):
+        write_varint(self.events, (tick - self.last_tick) << 3 | code)
+        self.last_tick = tick
+        for arg in args:
+            write_varint(self.events, arg)
+
+    def turn(self, tick, direction):
+        self.event(tick, DIRECTION_CODES[direction])
+
+    def resize(self, tick, cols, rows):
+        self.event(tick, RESIZE, cols, rows)
+
+    def set_multiplier(self, tick, multiplier):
+        self.multiplier = multiplier
+        self.event(tick, MULTIPLIER, multiplier)
+
+    def encode(self, sim):
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        header = [self.seed, self.cols, self.rows, self.speed, round(self.bonus_chance * 1000),
+                  self.food_points['normal'], self.food_points['bonus'], self.start_multiplier,
+                  DIRECTION_CODES[self.start_direction], len(self.start)]
+        for x, y in self.start:
+            header += [x, y]
+        header += [sim.ticks, sim.score, OUTCOMES.index(sim.outcome)]
+        for value in header:
+            write_varint(out, value)
+        return bytes(out + self.events)
+
+
+class ReplayWriter:
+    def __init__(self, directory=REPLAY_DIR):
+        self.directory = directory
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name='replay-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def save(self, replay, sim):
+        # Encoded now, while sim is still at the end of the game, and
+        # written by the background thread
+        path = os.path.join(self.directory, f'{int(time.time())}-{replay.seed:016x}.snr')
+        self.queue.put((path, replay.encode(sim)))
+        return path
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            path, data = item
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+            except OSError as error:
+                # The replay is lost, the game carries on
+                print(f'replay not saved: {error}', file=sys.stderr)
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+
+
+def check_size(cols, rows):
+    if not (1 <= cols <= MAX_SIDE and 1 <= rows <= MAX_SIDE):
+        raise ValueError(f'board {cols}x{rows} out of range')
+
+
+def decode(data):
+    if data[:3] != MAGIC or len(data) < 4 or data[3] != VERSION:
+        raise ValueError('not a snake replay')
+    pos = 4
+    values = []
+    for _ in range(10):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    seed, cols, rows, speed, bonus, normal_points, bonus_points, multiplier, direction, count = values
+    check_size(cols, rows)
+    if direction >= len(DIRECTION_NAMES):
+        raise ValueError(f'unknown start direction {direction}')
+    if not 1 <= count <= cols * rows:
+        raise ValueError(f'{count} start cells on a {cols}x{rows} board')
+    start = []
+    for _ in range(count):
+        x, pos = read_varint(data, pos)
+        y, pos = read_varint(data, pos)
+        if x >= cols or y >= rows:
+            raise ValueError(f'start cell {x},{y} off the board')
+        start.append((x, y))
+    if len(set(start)) != count:
+        raise ValueError('start cells overlap')
+    ticks, pos = read_varint(data, pos)
+    score, pos = read_varint(data, pos)
+    outcome, pos = read_varint(data, pos)
+    if outcome >= len(OUTCOMES):
+        raise ValueError(f'unknown outcome {outcome}')
+    return {
+        'seed': seed, 'cols': cols, 'rows': rows, 'speed': speed,
+        'bonus_chance': bonus / 1000, 'food_points': {'normal': normal_points, 'bonus': bonus_points},
+        'multiplier': multiplier, 'direction': DIRECTION_NAMES[direction], 'start': tuple(start),
+        'ticks': ticks, 'score': score, 'outcome': OUTCOMES[outcome], 'events': pos,
+    }
+
+
+def replay(data):
+    # Re-runs a replay from its seed and returns (header, sim at the end)
+    header = decode(data)
+    sim = SnakeSim(header['cols'], header['rows'], seed=header['seed'], start=header['start'],
+                   direction=header['direction'], food_points=header['food_points'],
+                   bonus_chance=header['bonus_chance'])
+    sim.multiplier = header['multiplier']
+    pos, tick, end = header['events'], 0, len(data)
+    while pos < end:
+        value, pos = read_varint(data, pos)
+        tick += value >> 3
+        code = value & 7
+        while sim.ticks < tick and not sim.over:
+            sim.step()
+        if code < RESIZE:
+            sim.turn(DIRECTION_NAMES[code])
+        elif code == RESIZE:
+            cols, pos = read_varint(data, pos)
+            rows, pos = read_varint(data, pos)
+            check_size(cols, rows)
+            sim.resize(cols, rows)
+        elif code == MULTIPLIER:
+            sim.multiplier, pos = read_varint(data, pos)
+        else:
+            raise ValueError(f'unknown replay event {code}')
+    while sim.ticks < header['ticks'] and not sim.over:
+        sim.step()
+    return header, sim
+
+
+def verify(path):
+    # (path, claimed score, replayed score or None if unreadable). Nothing
+    # in one file can stop a bulk run over the rest.
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        header, sim = replay(data)
+    except (OSError, ValueError, IndexError, MemoryError):
+        return path, None, None
+    if (sim.ticks, sim.outcome) != (header['ticks'], header['outcome']):
+        return path, header['score'], None
+    return path, header['score'], sim.score
+
+
+def replay_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.snr'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify snake replays without a display')
+    parser.add_argument('paths', nargs='*', default=[REPLAY_DIR], help='replay files or directories')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    args = parser.parse_args()
+
+    paths = list(replay_paths(args.paths))
+    start = time.perf_counter()
+    bad = 0
+    with ProcessPoolExecutor(args.jobs) as pool:
+        for path, claimed, actual in pool.map(verify, paths, chunksize=64):
+            if actual is None or claimed != actual:
+                bad += 1
+                print(f'MISMATCH {path}: claimed {claimed}, replayed {actual}')
+    elapsed = time.perf_counter() - start
+    print(f'{len(paths)} replays verified in {elapsed:.2f}s '
+          f'({len(paths) / max(elapsed, 1e-9):,.0f}/s), {bad} mismatched')
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
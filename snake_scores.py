@@ -0,0 +1,173 @@
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+
+# High scores kept in memory and persisted off the game thread.
+#
+# The store is an append-only log with one JSON record per line. Every
+# record goes out in a single O_APPEND write, so any number of game
+# processes can share one file without losing each other's updates, and a
+# crash can at worst leave one torn line behind, which loading skips.
+#
+# The log itself is never rewritten, since another process may be appending
+# to it. Instead the writer thread checkpoints the leaderboards, with the
+# log offset they cover, to scores.log.top every CHECKPOINT_BYTES of log,
+# and a new store reads only the log past the checkpoint.
+
+SCORES_PATH = 'scores.log'
+LEGACY_PATH = 'highscore.txt'
+CHECKPOINT_BYTES = 64 * 1024
+CHECKPOINT = object()  # Queued to ask the writer for a checkpoint if one is due
+
+
+class ScoreStore:
+    def __init__(self, path=SCORES_PATH, legacy_path=LEGACY_PATH, top=10):
+        self.path = path
+        self.checkpoint_path = path + '.top'
+        self.top = top
+        self.boards = {}  # (difficulty, speed) -> scores, best first
+        self.best = self.load_legacy(legacy_path)
+        self.offset = 0
+        self.own = Counter()  # Our records already counted but maybe not read back yet
+        self.lock = threading.Lock()
+        self.load_checkpoint()
+        self.checkpointed = self.offset
+        self.refresh()
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name='score-writer', daemon=True)
+        self.writer.start()
+        self.queue.put(CHECKPOINT)
+        atexit.register(self.close)
+
+    def load_legacy(self, path):
+        # The single number the game used to keep in highscore.txt
+        try:
+            with open(path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def load_checkpoint(self):
+        # Leaderboards as of some offset into the log. The checkpoint is
+        # only used while the log still ends that prefix with the same line,
+        # so a log deleted or replaced since is read from the start.
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            offset, tail = checkpoint['offset'], checkpoint['tail'].encode()
+            with open(self.path, 'rb') as f:
+                f.seek(max(offset - len(tail), 0))
+                if checkpoint['top'] < self.top or f.read(len(tail)) != tail:
+                    return
+            boards = {(difficulty, speed): [int(score) for score in scores[:self.top]]
+                      for difficulty, speed, scores in checkpoint['boards']}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return
+        self.boards = boards
+        self.best = max([self.best] + [scores[0] for scores in boards.values() if scores])
+        self.offset = offset
+
+    def save_checkpoint(self):
+        # Only while every record we counted has been read back from the
+        # log, so the boards are exactly the log up to offset
+        with self.lock:
+            if any(self.own.values()) or self.offset - self.checkpointed < CHECKPOINT_BYTES:
+                return
+            offset = self.offset
+            boards = [[difficulty, speed, list(scores)] for (difficulty, speed), scores in self.boards.items()]
+        with open(self.path, 'rb') as f:
+            f.seek(max(offset - 1024, 0))
+            data = f.read(offset - f.tell())
+        tail = data[data.rfind(b'\n', 0, len(data) - 1) + 1:]
+        temp = f'{self.checkpoint_path}.{os.getpid()}'
+        with open(temp, 'w') as f:
+            json.dump({'offset': offset, 'tail': tail.decode(errors='replace'), 'top': self.top,
+                       'boards': boards}, f, separators=(',', ':'))
+        os.replace(temp, self.checkpoint_path)
+        self.checkpointed = offset
+
+    def add(self, record):
+        score = record['score']
+        board = self.boards.setdefault((record['difficulty'], record['speed']), [])
+        if len(board) < self.top or score > board[-1]:
+            board.append(score)
+            board.sort(reverse=True)
+            del board[self.top:]
+        self.best = max(self.best, score)
+
+    def parse(self, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # A torn write glues a partial record onto the next one
+            start = line.rfind(b'{')
+            if start > 0:
+                return self.parse(line[start:])
+            return None
+        if not isinstance(record, dict) or not {'score', 'difficulty', 'speed'} <= record.keys():
+            return None
+        return record
+
+    def refresh(self):
+        # Read records appended since the last look, ours or other processes'
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b'\n') + 1
+        with self.lock:
+            for line in data[:end].splitlines(keepends=True):
+                if self.own[line]:
+                    self.own[line] -= 1
+                    continue
+                record = self.parse(line)
+                if record is not None:
+                    self.add(record)
+            self.offset += end
+
+    def submit(self, score, difficulty, speed):
+        # Visible in memory right away, written by the background thread
+        record = {'score': score, 'difficulty': difficulty, 'speed': speed,
+                  'time': int(time.time()), 'pid': os.getpid()}
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+        with self.lock:
+            self.add(record)
+            self.own[line] += 1
+        self.queue.put(line)
+
+    def write_loop(self):
+        while True:
+            line = self.queue.get()
+            if line is None:
+                return
+            if line is not CHECKPOINT:
+                try:
+                    fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                    try:
+                        os.write(fd, line)
+                    finally:
+                        os.close(fd)
+                    self.refresh()
+                except OSError as error:
+                    # The score stays on the in-memory leaderboard, the game carries on
+                    print(f'score not saved: {error}', file=sys.stderr)
+            try:
+                self.save_checkpoint()
+            except OSError:
+                pass  # The log has it all, the next store just reads more of it
+
+    def leaderboard(self, difficulty, speed):
+        with self.lock:
+            return list(self.boards.get((difficulty, speed), ()))
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import sys
+import time
+
+from snake_arena import ArenaSim, SPAWN, HEAD, TAIL, DEAD, FOOD, EATEN, SCORE, FOOD_TYPES
+from snake_core import FOOD_POINTS
+from snake_loop import LatencyLog
+from snake_replay import DIRECTION_NAMES, DIRECTION_CODES, write_varint, read_varint
+
+# An authoritative ArenaSim served over TCP with asyncio. Every player gets
+# a snake, which comes back a moment after it dies.
+#
+# Clients send single bytes, direction codes as in snake_replay. They are
+# queued on the snake as they arrive and one is applied per tick. The
+# server sends frames, each a varint payload length and then the payload:
+# a kind byte, the tick and, for DELTA frames, the tick's ArenaSim events
+# encoded below. A SYNC frame carries the client's player id and board size
+# and then the whole board as events, after which the deltas apply.
+#
+# The tick never waits for a client. Each tick's delta is encoded once and
+# written to every socket without awaiting drain. A client whose unsent
+# data goes over the limit gets nothing more until it has caught up, and
+# then a SYNC in place of the deltas it missed.
+
+DELTA = 0
+SYNC = 1
+PORT = 7777
+RESPAWN_TICKS = 12
+STATS_EVERY = 5.0  # Seconds between stats lines
+
+
+def encode_events(out, events):
+    for event in events:
+        code = event[0]
+        out.append(code)
+        if code == SPAWN:
+            _, id, direction, cells = event
+            write_varint(out, id)
+            out.append(DIRECTION_CODES[direction])
+            write_varint(out, len(cells))
+            for cell in cells:
+                write_varint(out, cell)
+        elif code == FOOD:
+            write_varint(out, event[1])
+            out.append(FOOD_TYPES.index(event[2]))
+        else:
+            for value in event[1:]:
+                write_varint(out, value)
+
+
+def decode_events(data, pos, end):
+    events = []
+    while pos < end:
+        code = data[pos]
+        pos += 1
+        if code == SPAWN:
+            id, pos = read_varint(data, pos)
+            direction = DIRECTION_NAMES[data[pos]]
+            count, pos = read_varint(data, pos + 1)
+            cells = []
+            for _ in range(count):
+                cell, pos = read_varint(data, pos)
+                cells.append(cell)
+            events.append((SPAWN, id, direction, cells))
+        elif code == FOOD:
+            cell, pos = read_varint(data, pos)
+            events.append((FOOD, cell, FOOD_TYPES[data[pos]]))
+            pos += 1
+        elif code in (TAIL, DEAD, EATEN):
+            value, pos = read_varint(data, pos)
+            events.append((code, value))
+        elif code in (HEAD, SCORE):
+            id, pos = read_varint(data, pos)
+            value, pos = read_varint(data, pos)
+            events.append((code, id, value))
+        else:
+            raise ValueError(f'bad event code {code}')
+    return events
+
+
+def frame(kind, tick, *values, body=b''):
+    # A frame around events already encoded into body
+    header = bytearray([kind])
+    write_varint(header, tick)
+    for value in values:
+        write_varint(header, value)
+    out = bytearray()
+    write_varint(out, len(header) + len(body))
+    return out + header + body
+
+
+def decode_frame(payload):
+    # (kind, tick, player id or None, board size or None, events)
+    kind = payload[0]
+    tick, pos = read_varint(payload, 1)
+    id = size = None
+    if kind == SYNC:
+        id, pos = read_varint(payload, pos)
+        cols, pos = read_varint(payload, pos)
+        rows, pos = read_varint(payload, pos)
+        size = cols, rows
+    return kind, tick, id, size, decode_events(payload, pos, len(payload))
+
+
+async def read_frame(reader):
+    # The next frame's payload from a StreamReader
+    length = shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return await reader.readexactly(length)
+        shift += 7
+
+
+class Client:
+    __slots__ = ('id', 'writer', 'synced', 'died')
+
+    def __init__(self, id, writer):
+        self.id = id
+        self.writer = writer
+        self.synced = False
+        self.died = None  # Tick the snake died on
+
+
+class ArenaServer:
+    def __init__(self, arena, rate, limit=64 * 1024):
+        self.arena = arena
+        self.rate = rate
+        self.limit = limit  # Unsent bytes a client may have before it is skipped
+        self.clients = {}
+        self.next_id = 1
+        self.jitter = LatencyLog()
+        self.tick_times = LatencyLog()
+        self.sent = 0
+        self.frames = 0
+        self.skipped = 0
+
+    async def handle(self, reader, writer):
+        id = self.next_id
+        self.next_id += 1
+        client = self.clients[id] = Client(id, writer)
+        self.arena.spawn(id)
+        try:
+            while True:
+                data = await reader.read(256)
+                if not data:
+                    break
+                for code in data:
+                    if code < len(DIRECTION_NAMES):
+                        self.arena.turn(id, DIRECTION_NAMES[code])
+        except ConnectionError:
+            pass
+        finally:
+            del self.clients[id]
+            self.arena.remove(id)
+            writer.close()
+
+    def tick(self):
+        arena = self.arena
+        for client in self.clients.values():
+            if client.id not in arena.snakes:
+                if client.died is None:
+                    client.died = arena.ticks
+                elif arena.ticks - client.died >= RESPAWN_TICKS and arena.spawn(client.id):
+                    client.died = None
+        body = bytearray()
+        encode_events(body, arena.step())
+        delta = frame(DELTA, arena.ticks, body=body)
+        state = None
+        for client in self.clients.values():
+            transport = client.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.limit:
+                client.synced = False
+                self.skipped += 1
+                continue
+            if client.synced:
+                data = delta
+            else:
+                if state is None:
+                    state = bytearray()
+                    encode_events(state, arena.state())
+                data = frame(SYNC, arena.ticks, client.id, arena.cols, arena.rows, body=state)
+                client.synced = True
+            client.writer.write(data)
+            self.sent += len(data)
+            self.frames += 1
+
+    async def listen(self, host, port):
+        # Start accepting players, returns the port (port 0 picks a free one)
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def run(self, report=True):
+        # Tick at the fixed rate until cancelled
+        loop = asyncio.get_running_loop()
+        step = 1.0 / self.rate
+        deadline = loop.time()
+        reported, ticks, sent = time.perf_counter(), 0, 0
+        while True:
+            deadline += step
+            await asyncio.sleep(deadline - loop.time())
+            now = loop.time()
+            self.jitter.add(now - deadline)
+            if now - deadline > step:
+                deadline = now  # Fell a whole tick behind, do not try to catch up
+            start = time.perf_counter()
+            self.tick()
+            self.tick_times.add(time.perf_counter() - start)
+            if report and start - reported >= STATS_EVERY:
+                print(self.stats(self.arena.ticks - ticks, self.sent - sent), flush=True)
+                reported, ticks, sent = start, self.arena.ticks, self.sent
+
+    def stats(self, ticks, sent):
+        return (f'tick {self.arena.ticks}: {len(self.clients)} clients, {len(self.arena.snakes)} snakes, '
+                f'{sent / max(ticks, 1):,.0f} bytes/tick, {self.skipped} frames skipped, '
+                f'jitter p50 {self.jitter.percentile(50) * 1000:.2f} '
+                f'p99 {self.jitter.percentile(99) * 1000:.2f} ms, '
+                f'tick p99 {self.tick_times.percentile(99) * 1000:.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a shared snake arena')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--size', default='128x128', help='board size in cells, COLSxROWS')
+    parser.add_argument('--rate', type=int, default=12, help='ticks per second')
+    parser.add_argument('--food', type=int, default=40, help='food on the board at once')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    cols, rows = (int(value) for value in args.size.split('x'))
+    arena = ArenaSim(cols, rows, seed=args.seed, food_count=args.food, food_points=FOOD_POINTS, bonus_chance=0.2)
+    server = ArenaServer(arena, args.rate)
+
+    async def serve():
+        port = await server.listen(args.host, args.port)
+        print(f'Serving a {cols}x{rows} arena on {args.host}:{port} at {args.rate} ticks/sec', flush=True)
+        await server.run()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from snake_app import STARTUP_BENCH_ENV
+
+# Cold-start benchmark: launches each game as a fresh process and reports
+# the time from launch to its first displayed frame.
+
+GAMES = ['snake-game.py', 'snake-game2.py', 'snake-game3.py']
+
+
+def measure(script, runs):
+    env = dict(os.environ)
+    env.setdefault('SDL_VIDEODRIVER', 'dummy')
+    env.setdefault('SDL_AUDIODRIVER', 'dummy')
+    times = []
+    for _ in range(runs):
+        env[STARTUP_BENCH_ENV] = repr(time.time())
+        result = subprocess.run([sys.executable, script], env=env, capture_output=True, text=True, timeout=60)
+        for line in result.stdout.splitlines():
+            if line.startswith('first_frame_ms='):
+                times.append(float(line.split('=', 1)[1]))
+                break
+        else:
+            raise RuntimeError(f'{script} did not report a first frame:\n{result.stdout}{result.stderr}')
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure process start to first frame')
+    parser.add_argument('games', nargs='*', default=GAMES)
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    args = parser.parse_args()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for game in args.games:
+        times = sorted(measure(os.path.join(here, game), args.runs))
+        print(f'{game}: median {statistics.median(times):.1f} ms, '
+              f'min {times[0]:.1f} ms, max {times[-1]:.1f} ms over {len(times)} runs')
+
+
+if __name__ == '__main__':
+    main()
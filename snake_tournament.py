@@ -0,0 +1,167 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from snake_core import SnakeSim, DIRECTIONS, FOOD_POINTS, DIFFICULTY_SPEEDS, ATE, WON, closest_move
+
+# Plays large numbers of seeded games headless on every core, with a policy
+# choosing the moves, under the rules of Game.update() in snake-game2.py.
+#
+# A policy is any importable function taking the SnakeSim and returning a
+# direction, named as 'module:function' on the command line. Results are
+# streamed to a directory with one raw array file per column and a
+# columns.json naming their array typecodes, so any column can be read on
+# its own with array.fromfile() or numpy.fromfile().
+
+COLS, ROWS = 32, 24  # The 640x480 window in 20 pixel cells
+BONUS_CHANCE = 0.2
+DIFFICULTIES = list(DIFFICULTY_SPEEDS)
+CAUSES = ['wall', 'self', 'won', 'timeout']
+COLUMNS = {
+    'seed': 'q',
+    'difficulty': 'B',  # Index into DIFFICULTIES
+    'speed': 'B',
+    'score': 'i',
+    'length': 'i',
+    'ticks': 'i',
+    'cause': 'B',  # Index into CAUSES
+}
+RESULTS_DIR = 'tournament'
+
+policy = None  # Loaded once per worker process
+
+
+def greedy(sim):
+    # Head for the food, never straight into a wall or the body
+    fx, fy = sim.food
+    direction = closest_move(sim.cols, sim.rows, sim.grid, sim.body[0], sim.direction, fy * sim.cols + fx)
+    return sim.direction if direction is None else direction
+
+
+def load_policy(name):
+    module, _, function = name.partition(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def init_worker(name):
+    global policy
+    policy = load_policy(name)
+
+
+def play(seed, difficulty, cols=COLS, rows=ROWS):
+    sim = SnakeSim(cols, rows, seed=seed, food_points=FOOD_POINTS, bonus_chance=BONUS_CHANCE)
+    sim.multiplier = 2 if difficulty == 'hard' else 1  # Double points on hard mode
+    # A policy that circles forever would never finish, so give up once the
+    # snake has gone a whole board's worth of ticks without eating
+    patience = cols * rows
+    hungry = 0
+    while not sim.over:
+        sim.turn(policy(sim))
+        if sim.step() == ATE:
+            hungry = 0
+        else:
+            hungry += 1
+            if hungry > patience:
+                return sim, 'timeout'
+    if sim.outcome == WON:
+        return sim, 'won'
+    # The dead head is never added, so look one step past the current one
+    x, y = sim.head
+    dx, dy = DIRECTIONS[sim.direction]
+    inside = 0 <= x + dx < sim.cols and 0 <= y + dy < sim.rows
+    return sim, 'self' if inside else 'wall'
+
+
+def play_chunk(first, count, difficulty, base_seed):
+    # Games first .. first + count - 1, as one array per column
+    columns = {name: array(code) for name, code in COLUMNS.items()}
+    for game in range(first, first + count):
+        level = difficulty or DIFFICULTIES[game % len(DIFFICULTIES)]
+        seed = base_seed + game
+        sim, cause = play(seed, level)
+        columns['seed'].append(seed)
+        columns['difficulty'].append(DIFFICULTIES.index(level))
+        columns['speed'].append(DIFFICULTY_SPEEDS[level])
+        columns['score'].append(sim.score)
+        columns['length'].append(len(sim))
+        columns['ticks'].append(sim.ticks)
+        columns['cause'].append(CAUSES.index(cause))
+    return columns
+
+
+class ColumnWriter:
+    def __init__(self, directory, meta):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'columns.json'), 'w') as f:
+            json.dump({'columns': COLUMNS, 'difficulties': DIFFICULTIES, 'causes': CAUSES, **meta}, f, indent=1)
+        self.files = {name: open(os.path.join(directory, name), 'wb') for name in COLUMNS}
+
+    def write(self, columns):
+        for name, f in self.files.items():
+            columns[name].tofile(f)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def load_results(directory):
+    with open(os.path.join(directory, 'columns.json')) as f:
+        meta = json.load(f)
+    columns = {}
+    for name, code in meta['columns'].items():
+        column = columns[name] = array(code)
+        with open(os.path.join(directory, name), 'rb') as f:
+            column.frombytes(f.read())
+    return meta, columns
+
+
+def summarize(meta, columns):
+    games = len(columns['score'])
+    if not games:
+        return 'no games'
+    scores = columns['score']
+    causes = {cause: 0 for cause in meta['causes']}
+    for code in columns['cause']:
+        causes[meta['causes'][code]] += 1
+    return (f'{games} games: mean score {sum(scores) / games:.2f}, best {max(scores)}, '
+            f'mean length {sum(columns["length"]) / games:.1f}, '
+            + ', '.join(f'{cause} {count}' for cause, count in causes.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play seeded snake games with a policy on every core')
+    parser.add_argument('-n', '--games', type=int, default=10000)
+    parser.add_argument('--policy', default='snake_tournament:greedy', help='module:function')
+    parser.add_argument('--difficulty', choices=DIFFICULTIES, help='default: cycle through all of them')
+    parser.add_argument('--seed', type=int, default=0, help='game i is played with seed + i')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--chunk', type=int, default=250, help='games per work unit')
+    parser.add_argument('-o', '--out', default=RESULTS_DIR, help='results directory')
+    args = parser.parse_args()
+
+    load_policy(args.policy)  # Fail here rather than in every worker
+    writer = ColumnWriter(args.out, {'policy': args.policy, 'seed': args.seed, 'cols': COLS, 'rows': ROWS})
+    firsts = range(0, args.games, args.chunk)
+    counts = [min(args.chunk, args.games - first) for first in firsts]
+    start = time.perf_counter()
+    ticks = 0
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=(args.policy,)) as pool:
+        for columns in pool.map(play_chunk, firsts, counts, [args.difficulty] * len(counts),
+                                [args.seed] * len(counts)):
+            writer.write(columns)
+            ticks += sum(columns['ticks'])
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print(f'{args.games} games, {ticks} ticks in {elapsed:.2f}s with {args.jobs} workers: '
+          f'{args.games / elapsed:,.0f} games/sec, {ticks / elapsed:,.0f} ticks/sec')
+    print(summarize(*load_results(args.out)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())